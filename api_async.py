@@ -0,0 +1,88 @@
+# api_async.py
+"""
+Асинхронный вариант api_client: один event loop asyncio в фоновом потоке.
+
+Блокирующие вызовы api_client выполняются в executor'е этого цикла (через
+общую пул-сессию requests), поэтому несколько запросов идут параллельно,
+а gather() ждёт их вместе: время = максимум, а не сумма.
+
+В Qt результат приходит сигналами:
+    r = api_async.run_qt(api_async.gather_settled(updates=api_async.get_updates()))
+    r.ok.connect(self._on_data)
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import Future
+
+import api_client
+import task_pool
+
+_loop: asyncio.AbstractEventLoop | None = None
+_loop_lock = threading.Lock()
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            # блокирующие вызовы идут в общий пул задач, отдельных потоков не заводится
+            loop.set_default_executor(task_pool.shared().executor)
+            threading.Thread(target=loop.run_forever, name="api-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+async def call(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(fn, *args, **kwargs))
+
+
+async def call_kind(kind: str, fn, *args, **kwargs):
+    """
+    Как call(), но через очередь вида kind пула задач: лимит вида и
+    task_pool.busy(kind) учитывают и этот вызов.
+    """
+    return await asyncio.wrap_future(task_pool.shared().submit(kind, fn, *args, **kwargs))
+
+
+async def get_training_history(limit: int = 2000):
+    return await call(api_client.get_training_history, limit)
+
+
+async def get_updates():
+    return await call(api_client.get_updates)
+
+
+async def get_maintenance_status():
+    return await call(api_client.get_maintenance_status)
+
+
+async def gather_settled(**coros) -> dict:
+    """
+    Запускает корутины параллельно. Результат: {имя: (True, значение)}
+    или {имя: (False, текст ошибки)} — одна упавшая не отменяет остальные.
+    """
+    names = list(coros)
+    results = await asyncio.gather(*coros.values(), return_exceptions=True)
+    out = {}
+    for name, res in zip(names, results):
+        if isinstance(res, BaseException):
+            out[name] = (False, str(res))
+        else:
+            out[name] = (True, res)
+    return out
+
+
+def submit(coro) -> Future:
+    return asyncio.run_coroutine_threadsafe(coro, get_loop())
+
+
+class AsyncResult(task_pool.Task):
+    def __init__(self, coro):
+        super().__init__(submit(coro))
+
+
+def run_qt(coro) -> AsyncResult:
+    return AsyncResult(coro)
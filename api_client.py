@@ -1,4 +1,9 @@
+import time
+import threading
+from concurrent.futures import Future
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from typing import Optional, Dict, Any, List
 
 BASE_URL = "https://retinoserver.onrender.com"
@@ -6,6 +11,163 @@ BASE_URL = "https://retinoserver.onrender.com"
 _timeout = 10
 _token: Optional[str] = None
 
+# (connect, read) по группам эндпоинтов; холодный старт Render — до ~10 с на connect
+TIMEOUTS: Dict[str, Any] = {
+    "auth": (10, 15),
+    "public": (10, 10),
+    "status": (10, 5),
+    "training_read": (10, 20),
+    "training_write": (10, 15),
+}
+
+# повторы только для идемпотентных GET; POST не повторяется вовсе,
+# в том числе при ошибке соединения (см. _GetOnlyRetry)
+RETRIES = 3
+BACKOFF = 0.5
+POOL_SIZE = 8
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def _timeout_for(group: str):
+    return TIMEOUTS.get(group, _timeout)
+
+
+class _GetOnlyRetry(Retry):
+    """
+    urllib3 повторяет ошибки соединения для любого метода, не глядя на
+    allowed_methods. Для записи это лишние RETRIES x connect-таймаут
+    ожидания без сети (вход, отправка результатов), а повтор записи —
+    забота вызывающего (outbox с ключами идемпотентности).
+    """
+
+    def increment(self, method=None, url=None, *args, **kwargs):
+        retry = self
+        if method and not self._is_method_retryable(method):
+            retry = self.new(total=0)
+        return super(_GetOnlyRetry, retry).increment(method, url, *args, **kwargs)
+
+
+def _get_session() -> requests.Session:
+    """
+    Общая сессия с пулом keep-alive соединений: TCP+TLS к серверу
+    устанавливается один раз, а не на каждый запрос.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = _GetOnlyRetry(
+                total=RETRIES,
+                backoff_factor=BACKOFF,
+                status_forcelist=(429, 500, 502, 503, 504),
+                allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+                raise_on_status=False,
+                respect_retry_after_header=True,
+            )
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=POOL_SIZE, max_retries=retry)
+            s = requests.Session()
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+
+def configure(retries: Optional[int] = None, backoff: Optional[float] = None,
+              timeouts: Optional[Dict[str, Any]] = None, pool_size: Optional[int] = None) -> None:
+    global RETRIES, BACKOFF, POOL_SIZE, _session
+    with _session_lock:
+        if retries is not None:
+            RETRIES = int(retries)
+        if backoff is not None:
+            BACKOFF = float(backoff)
+        if pool_size is not None:
+            POOL_SIZE = int(pool_size)
+        if timeouts:
+            TIMEOUTS.update(timeouts)
+        if _session is not None:
+            _session.close()
+            _session = None
+
+
+# кэш ответов публичных эндпоинтов: свежесть по TTL, затем ревалидация ETag/Last-Modified
+CACHE_TTL: Dict[str, float] = {
+    "updates": 300.0,
+    "maintenance": 10.0,
+}
+
+_cache: Dict[str, Dict[str, Any]] = {}
+_inflight: Dict[str, Future] = {}
+_cache_lock = threading.Lock()
+
+
+def invalidate_cache(key: Optional[str] = None) -> None:
+    with _cache_lock:
+        if key is None:
+            _cache.clear()
+        else:
+            _cache.pop(key, None)
+
+
+def _cached_get_json(key: str, path: str, group: str) -> Any:
+    """
+    GET с кэшем: пока запись свежа — без сети; после TTL — условный запрос
+    (304 продлевает запись). Параллельные вызовы с одним ключом ждут один
+    и тот же запрос, а не отправляют свои; его ошибка достаётся всем.
+
+    Ошибка при ревалидации пробрасывается, устаревшая копия не отдаётся:
+    вызывающие по ошибке понимают, что сервер недоступен (опрос тех. работ
+    увеличивает интервал, вход и регистрация не полагаются на старый
+    статус). Запись при этом остаётся, и следующая попытка снова будет
+    условной.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        ent = _cache.get(key)
+        if ent is not None and ent["expires"] > now:
+            return ent["data"]
+        fut = _inflight.get(key)
+        owner = fut is None
+        if owner:
+            fut = Future()
+            _inflight[key] = fut
+
+    if not owner:
+        return fut.result()
+
+    try:
+        headers = _headers()
+        if ent is not None:
+            if ent.get("etag"):
+                headers["If-None-Match"] = ent["etag"]
+            if ent.get("last_modified"):
+                headers["If-Modified-Since"] = ent["last_modified"]
+
+        r = _get_session().get(f"{BASE_URL}{path}", headers=headers, timeout=_timeout_for(group))
+        if r.status_code == 304 and ent is not None:
+            data = ent["data"]
+            etag, last_modified = ent.get("etag"), ent.get("last_modified")
+        else:
+            r.raise_for_status()
+            data = r.json()
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+
+        with _cache_lock:
+            _cache[key] = {
+                "data": data,
+                "etag": etag,
+                "last_modified": last_modified,
+                "expires": time.monotonic() + CACHE_TTL.get(key, 0.0),
+            }
+        fut.set_result(data)
+        return data
+    except BaseException as e:
+        fut.set_exception(e)
+        raise
+    finally:
+        with _cache_lock:
+            _inflight.pop(key, None)
+
 
 def _headers() -> Dict[str, str]:
     h = {"Content-Type": "application/json"}
@@ -15,11 +177,11 @@ def _headers() -> Dict[str, str]:
 
 
 def register_user(username: str, password: str) -> bool:
-    r = requests.post(
+    r = _get_session().post(
         f"{BASE_URL}/auth/register",
         json={"username": username, "password": password},
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("auth"),
     )
     if r.status_code == 200:
         return True
@@ -34,11 +196,11 @@ def username_status(username: str) -> str:
     Ожидаемые ответы:
       {"status":"ok"} или {"status":"deleted"} или {"status":"exists"}
     """
-    r = requests.post(
+    r = _get_session().post(
         f"{BASE_URL}/auth/username_status",
         json={"username": username},
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("auth"),
     )
     if r.status_code == 200:
         data = r.json()
@@ -52,11 +214,11 @@ def username_status(username: str) -> str:
 def authenticate_user(username: str, password: str) -> bool:
     global _token
     try:
-        r = requests.post(
+        r = _get_session().post(
             f"{BASE_URL}/auth/login",
             json={"username": username, "password": password},
             headers=_headers(),
-            timeout=_timeout,
+            timeout=_timeout_for("auth"),
         )
 
         if r.status_code == 200:
@@ -80,33 +242,31 @@ def logout() -> None:
     _token = None
 
 def change_password(username: str, old_password: str, new_password: str) -> bool:
-    r = requests.post(
+    r = _get_session().post(
         f"{BASE_URL}/auth/change_password",
         json={"username": username, "old_password": old_password, "new_password": new_password},
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("auth"),
     )
     return r.status_code == 200
 
 
 def delete_user_soft(confirm_phrase: str = "delete my account") -> bool:
-    r = requests.post(
+    r = _get_session().post(
         f"{BASE_URL}/auth/delete_user",
         json={"confirm": confirm_phrase},
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("auth"),
     )
     return r.status_code == 200
 
 def get_updates() -> List[Dict[str, Any]]:
-    r = requests.get(f"{BASE_URL}/public/updates", headers=_headers(), timeout=_timeout)
-    r.raise_for_status()
-    data = r.json()
+    data = _cached_get_json("updates", "/public/updates", "public")
     if isinstance(data, list):
-        return data
+        return list(data)
     return []
 
-def save_training_record(user_stage: int, ai_stage: int, score: int, dice: float, p_max: float, ts: Optional[str] = None) -> bool:
+def _record_payload(user_stage: int, ai_stage: int, score: int, dice: float, p_max: float, ts: Optional[str] = None) -> Dict[str, Any]:
     payload = {
         "user_stage": int(user_stage),
         "ai_stage": int(ai_stage),
@@ -116,21 +276,162 @@ def save_training_record(user_stage: int, ai_stage: int, score: int, dice: float
     }
     if ts:
         payload["ts"] = ts
+    return payload
+
 
-    r = requests.post(
+def _post_record(payload: Dict[str, Any], idempotency_key: Optional[str] = None) -> requests.Response:
+    headers = _headers()
+    if idempotency_key:
+        # повтор той же записи из очереди сервер не должен сохранять дважды
+        headers["Idempotency-Key"] = idempotency_key
+
+    return _get_session().post(
         f"{BASE_URL}/training/record",
         json=payload,
-        headers=_headers(),
-        timeout=_timeout,
+        headers=headers,
+        timeout=_timeout_for("training_write"),
     )
-    return r.status_code == 200
 
-def get_training_history(limit: int = 2000) -> List[Dict[str, Any]]:
-    r = requests.get(
+
+def save_training_record(user_stage: int, ai_stage: int, score: int, dice: float, p_max: float, ts: Optional[str] = None,
+                         idempotency_key: Optional[str] = None) -> bool:
+    payload = _record_payload(user_stage, ai_stage, score, dice, p_max, ts)
+    return _post_record(payload, idempotency_key).status_code == 200
+
+
+def _rejects(status_code: int) -> bool:
+    """4xx, который не исправится повтором (в отличие от 401/403/408/429)."""
+    return 400 <= status_code < 500 and status_code not in (401, 403, 408, 429)
+
+
+# пакетная отправка: POST /training/records {"records": [...]}
+BULK_CHUNK = 100
+_bulk_supported: Optional[bool] = None
+# причина для записей, до которых не дошло из-за сетевой ошибки
+NETWORK_ERROR = "network"
+
+
+def _save_one(rec: Dict[str, Any]) -> Optional[str]:
+    payload = _record_payload(rec.get("user_stage", 0), rec.get("ai_stage", 0), rec.get("score", 0),
+                              rec.get("dice", 0.0), rec.get("p_max", 0.0), rec.get("ts"))
+    r = _post_record(payload, rec.get("idempotency_key"))
+    if r.status_code == 200:
+        return None
+    return "rejected" if _rejects(r.status_code) else f"HTTP {r.status_code}"
+
+
+def _save_each(chunk: List[Dict[str, Any]], results: List[Optional[str]]) -> bool:
+    """По одной записи; False — сеть оборвалась, остаток не отправлен."""
+    for rec in chunk:
+        try:
+            results.append(_save_one(rec))
+        except requests.RequestException:
+            return False
+    return True
+
+
+def _bulk_results(data: Any, n: int) -> List[Optional[str]]:
+    """
+    Разбор ответа пакетного запроса. Сервер может вернуть
+    {"results": [{"ok": bool, "error": str} | bool, ...]} по записям или
+    {"failed": [{"index": i, "error": str} | i, ...]}; без этих полей
+    считается, что сохранены все.
+    """
+    out: List[Optional[str]] = [None] * n
+    if not isinstance(data, dict):
+        return out
+    results = data.get("results")
+    if isinstance(results, list) and len(results) == n:
+        for i, r in enumerate(results):
+            if isinstance(r, dict):
+                ok, err = bool(r.get("ok", True)), r.get("error")
+            else:
+                ok, err = bool(r), None
+            if not ok:
+                out[i] = str(err or "rejected")
+        return out
+    for f in data.get("failed") or []:
+        i, err = (f.get("index"), f.get("error")) if isinstance(f, dict) else (f, None)
+        if isinstance(i, int) and 0 <= i < n:
+            out[i] = str(err or "rejected")
+    return out
+
+
+def save_training_records(records: List[Dict[str, Any]]) -> List[Optional[str]]:
+    """
+    Отправляет много записей пачками по BULK_CHUNK за запрос.
+
+    Возвращает список той же длины: None — запись сохранена, строка —
+    причина отказа: "HTTP <код>" — временная ошибка сервера, остальное —
+    отказ по самой записи. Если сервер не знает пакетного маршрута (404/405/501),
+    записи уходят по одной, и дальше пакетный маршрут не пробуется.
+    Пачка, отклонённая целиком (4xx), тоже отправляется по одной, чтобы
+    одна плохая запись не блокировала остальные. Сетевая ошибка не
+    пробрасывается: уже полученные результаты возвращаются, а всем
+    записям, до которых не дошло, ставится NETWORK_ERROR. Повтор
+    отправленного не задвоится, если у записей есть idempotency_key.
+    """
+    global _bulk_supported
+    results: List[Optional[str]] = []
+    for start in range(0, len(records), BULK_CHUNK):
+        chunk = records[start:start + BULK_CHUNK]
+        if _bulk_supported is False:
+            if not _save_each(chunk, results):
+                break
+            continue
+
+        payload = []
+        for rec in chunk:
+            p = _record_payload(rec.get("user_stage", 0), rec.get("ai_stage", 0), rec.get("score", 0),
+                                rec.get("dice", 0.0), rec.get("p_max", 0.0), rec.get("ts"))
+            if rec.get("idempotency_key"):
+                p["idempotency_key"] = rec["idempotency_key"]
+            payload.append(p)
+
+        try:
+            r = _get_session().post(
+                f"{BASE_URL}/training/records",
+                json={"records": payload},
+                headers=_headers(),
+                timeout=_timeout_for("training_write"),
+            )
+        except requests.RequestException:
+            break
+        if r.status_code in (404, 405, 501):
+            _bulk_supported = False
+            if not _save_each(chunk, results):
+                break
+        elif r.status_code in (200, 201, 207):
+            _bulk_supported = True
+            try:
+                data = r.json()
+            except ValueError:
+                data = None
+            results.extend(_bulk_results(data, len(chunk)))
+        elif _rejects(r.status_code):
+            if not _save_each(chunk, results):
+                break
+        else:
+            results.extend([f"HTTP {r.status_code}"] * len(chunk))
+    results.extend([NETWORK_ERROR] * (len(records) - len(results)))
+    return results
+
+def get_training_history(limit: int = 2000, since_id: Optional[int] = None, since_ts: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    since_id / since_ts — курсор инкрементальной синхронизации: вернуть
+    только записи новее. Старый сервер параметры игнорирует и отдаёт всё,
+    это обрабатывает history_sync.
+    """
+    params: Dict[str, Any] = {"limit": int(limit)}
+    if since_id is not None:
+        params["since_id"] = int(since_id)
+    if since_ts:
+        params["since"] = since_ts
+    r = _get_session().get(
         f"{BASE_URL}/training/history",
-        params={"limit": int(limit)},
+        params=params,
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("training_read"),
     )
     r.raise_for_status()
     data = r.json()
@@ -138,17 +439,15 @@ def get_training_history(limit: int = 2000) -> List[Dict[str, Any]]:
 
 
 def get_maintenance_status() -> Dict[str, Any]:
-    r = requests.get(f"{BASE_URL}/status/maintenance", headers=_headers(), timeout=_timeout)
-    r.raise_for_status()
-    data = r.json()
+    data = _cached_get_json("maintenance", "/status/maintenance", "status")
     if isinstance(data, dict):
-        return data
+        return dict(data)
     return {"enabled": False, "message": ""}
 
 def reset_training_history() -> bool:
-    r = requests.post(
+    r = _get_session().post(
         f"{BASE_URL}/training/reset",
         headers=_headers(),
-        timeout=_timeout,
+        timeout=_timeout_for("training_write"),
     )
     return r.status_code == 200
\ No newline at end of file
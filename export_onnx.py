@@ -0,0 +1,84 @@
+# export_onnx.py
+"""
+Экспорт models/best_cls.pt в ONNX-граф, из которого Grad-CAM считается
+без PyTorch.
+
+Градиент логита по выходу conv_head у EfficientNet считается аналитически:
+дальше идут только bn2 (в eval — поканальная аффинная), SiLU, global avg
+pool и линейный classifier. Поэтому граф, кроме логитов, отдаёт
+активации conv_head [N,K,h,w] и веса Grad-CAM для каждого класса [N,C,K]
+(средний по пространству градиент). ml_local собирает карту как
+relu(sum_k w[c,k] * A[k]).
+
+    python export_onnx.py [models_dir]
+"""
+import os
+import sys
+import inspect
+
+import torch
+import timm
+
+
+class CamExport(torch.nn.Module):
+    def __init__(self, model):
+        super().__init__()
+        self.m = model
+        bn = model.bn2
+        if not isinstance(getattr(bn, "act", None), torch.nn.SiLU):
+            raise RuntimeError("Ожидается bn2 с активацией SiLU (tf_efficientnet_b0)")
+
+    def forward(self, image):
+        m = self.m
+        x = m.bn1(m.conv_stem(image))
+        x = m.blocks(x)
+        act = m.conv_head(x)
+
+        bn = m.bn2
+        scale = bn.weight / torch.sqrt(bn.running_var + bn.eps)
+        shift = bn.bias - bn.running_mean * scale
+        s = act * scale[None, :, None, None] + shift[None, :, None, None]
+        sig = torch.sigmoid(s)
+        pooled = (s * sig).mean(dim=(2, 3))
+        logits = m.classifier(pooled)
+
+        # d logit_c / d act[k,y,x] = W[c,k] * scale[k] * silu'(s[k,y,x]) / (h*w)
+        dsilu = sig * (1.0 + s * (1.0 - sig))
+        g = dsilu.mean(dim=(2, 3)) * scale[None, :] / float(act.shape[2] * act.shape[3])
+        cam_weights = m.classifier.weight[None, :, :] * g[:, None, :]
+        return logits, act, cam_weights
+
+
+def export(models_dir: str = "models", size: int = 224) -> str:
+    pt_path = os.path.join(models_dir, "best_cls.pt")
+    out_path = os.path.join(models_dir, "dr_stage_cam.onnx")
+
+    model = timm.create_model("tf_efficientnet_b0", pretrained=False, num_classes=5)
+    model.load_state_dict(torch.load(pt_path, map_location="cpu"))
+    model.eval()
+
+    kw = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kw["dynamo"] = False
+
+    with torch.no_grad():
+        torch.onnx.export(
+            CamExport(model),
+            torch.zeros(1, 3, size, size),
+            out_path,
+            input_names=["image"],
+            output_names=["logits", "act", "cam_weights"],
+            dynamic_axes={"image": {0: "n"}, "logits": {0: "n"}, "act": {0: "n"}, "cam_weights": {0: "n"}},
+            opset_version=17,
+            **kw,
+        )
+    return out_path
+
+
+def main():
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else "models"
+    print(export(models_dir))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+# heatmap_cache.py
+"""
+Кэш результатов анализа (stage_id, probs, Grad-CAM 224x224) для снимков.
+
+Ключ записи: sha1 содержимого изображения + хэш файлов модели. При замене
+models/dr_stage.onnx или best_cls.pt (или смене варианта модели) хэш
+меняется, и старые записи перестают находиться автоматически.
+
+Предрасчёт для папки samples:
+    python heatmap_cache.py [samples_dir]
+"""
+import os
+import sys
+import shutil
+import hashlib
+import threading
+import numpy as np
+
+import runtime_config
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(BASE_DIR, "cache", "heatmaps")
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp")
+
+_lock = threading.Lock()
+_file_hashes: dict = {}
+
+
+def file_hash(path: str) -> str:
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _lock:
+        h = _file_hashes.get(key)
+    if h is not None:
+        return h
+
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            sha.update(block)
+    h = sha.hexdigest()
+    with _lock:
+        _file_hashes[key] = h
+    return h
+
+
+def _model_files(models_dir: str) -> list:
+    files = []
+    for name in ("dr_stage", "dr_stage_cam"):
+        path = runtime_config.model_path(models_dir, name)
+        files += [path, path + ".data"]
+    files.append(os.path.join(models_dir, "best_cls.pt"))
+    return files
+
+
+def model_hash(models_dir: str = "models") -> str | None:
+    sha = hashlib.sha1()
+    found = False
+    for path in _model_files(models_dir):
+        if os.path.exists(path):
+            sha.update(os.path.basename(path).encode("utf-8"))
+            sha.update(file_hash(path).encode("ascii"))
+            found = True
+    return sha.hexdigest()[:16] if found else None
+
+
+def _entry_path(image_path: str, models_dir: str) -> str | None:
+    mh = model_hash(models_dir)
+    if mh is None:
+        return None
+    return os.path.join(CACHE_DIR, mh, file_hash(image_path) + ".npz")
+
+
+def lookup(image_path: str, models_dir: str = "models") -> dict | None:
+    try:
+        path = _entry_path(image_path, models_dir)
+        if path is None or not os.path.exists(path):
+            return None
+        with np.load(path) as z:
+            probs = z["probs"].astype(np.float32)
+            return {
+                "stage_id": int(z["stage_id"]),
+                "p_max": float(np.max(probs)),
+                "probs": [float(p) for p in probs],
+                "heatmap": z["heatmap"].astype(np.float32),
+            }
+    except Exception:
+        return None
+
+
+def store(image_path: str, data: dict, models_dir: str = "models") -> None:
+    path = _entry_path(image_path, models_dir)
+    if path is None:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp,
+        stage_id=np.int64(data["stage_id"]),
+        probs=np.asarray(data["probs"], dtype=np.float32),
+        heatmap=np.asarray(data["heatmap"], dtype=np.float32),
+    )
+    os.replace(tmp, path)
+
+
+def prune(models_dir: str = "models") -> None:
+    """Удаляет записи, посчитанные другими версиями модели."""
+    mh = model_hash(models_dir)
+    if not os.path.isdir(CACHE_DIR):
+        return
+    for name in os.listdir(CACHE_DIR):
+        if name != mh:
+            shutil.rmtree(os.path.join(CACHE_DIR, name), ignore_errors=True)
+
+
+def precompute(samples_dir: str, models_dir: str = "models", batch_size: int = 8) -> int:
+    import ml_local
+
+    paths = []
+    for root, _, fnames in os.walk(samples_dir):
+        for f in fnames:
+            if f.lower().endswith(IMAGE_EXTS):
+                p = os.path.join(root, f)
+                if lookup(p, models_dir) is None:
+                    paths.append(p)
+
+    prune(models_dir)
+    if not paths:
+        return 0
+
+    model = ml_local.get_model()
+    for p, data in zip(paths, model.infer_batch(paths, batch_size=batch_size)):
+        store(p, data, models_dir)
+    return len(paths)
+
+
+def main():
+    samples_dir = sys.argv[1] if len(sys.argv) > 1 else os.path.join(BASE_DIR, "samples")
+    n = precompute(samples_dir)
+    print(f"Посчитано новых записей: {n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+# history_store.py
+"""
+Локальное хранилище истории тренировок (SQLite).
+
+Сюда пишутся все новые результаты (write-through к save_training_record) и
+всё, что пришло с сервера при синхронизации. Статистика для главной и
+страницы «Статистика» считается SQL-агрегатами, в том числе без сети.
+Локальная запись и та же запись с сервера совпадают по (ts, стадии, оценка):
+ts задаёт клиент, а перед сохранением он приводится к одному виду
+(_canon_ts), так что разница в записи времени на сервере не мешает.
+Кроме того, у локальной записи хранится ключ идемпотентности (client_key):
+если сервер отдаёт его в истории, копии сопоставляются по нему, а полная
+синхронизация удаляет уже отправленные локальные записи, которым не нашлась
+пара, — иначе при любом расхождении ts результат считался бы дважды.
+
+Таблица outbox — очередь ещё не отправленных записей (см. training_outbox).
+"""
+import json
+import sqlite3
+import datetime
+import time
+import threading
+from typing import Any, Dict, List, Optional
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS training (
+    username    TEXT    NOT NULL,
+    ts          TEXT    NOT NULL,
+    user_stage  INTEGER NOT NULL,
+    ai_stage    INTEGER NOT NULL,
+    score       INTEGER NOT NULL,
+    dice        REAL    NOT NULL DEFAULT 0,
+    p_max       REAL    NOT NULL DEFAULT 0,
+    server_id   INTEGER,
+    client_key  TEXT,                  -- ключ идемпотентности локальной записи
+    PRIMARY KEY (username, ts, user_stage, ai_stage, score)
+);
+CREATE INDEX IF NOT EXISTS idx_training_user_ts ON training(username, ts);
+CREATE INDEX IF NOT EXISTS idx_training_user_stage ON training(username, ai_stage);
+CREATE INDEX IF NOT EXISTS idx_training_user_server_id ON training(username, server_id);
+
+CREATE TABLE IF NOT EXISTS outbox (
+    key         TEXT    PRIMARY KEY,   -- ключ идемпотентности
+    username    TEXT    NOT NULL,
+    payload     TEXT    NOT NULL,
+    attempts    INTEGER NOT NULL DEFAULT 0,
+    next_try    REAL    NOT NULL DEFAULT 0,
+    last_error  TEXT,
+    parked      INTEGER NOT NULL DEFAULT 0  -- 1: попытки исчерпаны, больше не отправляется
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_user_next ON outbox(username, next_try);
+"""
+
+_UPSERT = """
+INSERT INTO training (username, ts, user_stage, ai_stage, score, dice, p_max, server_id, client_key)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (username, ts, user_stage, ai_stage, score) DO UPDATE SET
+    dice = excluded.dice,
+    p_max = excluded.p_max,
+    server_id = COALESCE(excluded.server_id, training.server_id),
+    client_key = COALESCE(training.client_key, excluded.client_key)
+"""
+
+# серверная копия с тем же ключом идемпотентности заменяет локальную запись
+_DROP_LOCAL_COPY = "DELETE FROM training WHERE username = ? AND client_key = ? AND server_id IS NULL"
+
+
+def _canon_ts(ts: Any) -> str:
+    """
+    Время в виде, в котором его пишет клиент: локальное, без зоны,
+    'YYYY-MM-DDTHH:MM:SS'. Сервер может вернуть его с Z/смещением,
+    пробелом вместо T или долями секунды.
+    """
+    s = str(ts).strip()
+    try:
+        t = datetime.datetime.fromisoformat(s.replace("Z", "+00:00"))
+    except ValueError:
+        return s
+    if t.tzinfo is not None:
+        t = t.astimezone().replace(tzinfo=None)
+    return t.isoformat(timespec="seconds")
+
+
+def _row(username: str, r: Dict[str, Any], client_key: Optional[str] = None) -> Optional[tuple]:
+    ts = r.get("ts")
+    if not ts:
+        return None
+    rid = r.get("id")
+    return (
+        username,
+        _canon_ts(ts),
+        int(r.get("user_stage", 0) or 0),
+        int(r.get("ai_stage", 0) or 0),
+        int(r.get("score", 0) or 0),
+        float(r.get("dice", 0.0) or 0.0),
+        float(r.get("p_max", 0.0) or 0.0),
+        int(rid) if isinstance(rid, int) else None,
+        client_key or r.get("idempotency_key") or None,
+    )
+
+
+class HistoryStore:
+    def __init__(self, path: str, username: str):
+        self.path = path
+        self.username = username
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        with self._lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_SCHEMA)
+            cols = {r[1] for r in self._db.execute("PRAGMA table_info(training)")}
+            if "client_key" not in cols:
+                self._db.execute("ALTER TABLE training ADD COLUMN client_key TEXT")
+            cols = {r[1] for r in self._db.execute("PRAGMA table_info(outbox)")}
+            if "parked" not in cols:
+                self._db.execute("ALTER TABLE outbox ADD COLUMN parked INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def add(self, rec: Dict[str, Any], outbox_key: Optional[str] = None) -> None:
+        """
+        Сохраняет запись. С outbox_key она в той же транзакции ставится
+        в очередь на отправку.
+        """
+        row = _row(self.username, rec, outbox_key)
+        if row is None:
+            return
+        with self._lock, self._db:
+            self._db.execute(_UPSERT, row)
+            if outbox_key:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO outbox (key, username, payload) VALUES (?, ?, ?)",
+                    (outbox_key, self.username, json.dumps(rec, ensure_ascii=False)),
+                )
+
+    def outbox_due(self, limit: int = 50) -> List[tuple]:
+        """[(key, record, attempts)] — записи, которые пора отправить."""
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT key, payload, attempts FROM outbox WHERE username = ? AND parked = 0 AND next_try <= ? "
+                "ORDER BY rowid LIMIT ?",
+                (self.username, time.time(), int(limit)),
+            )
+            return [(k, json.loads(p), int(a)) for k, p, a in cur.fetchall()]
+
+    def outbox_done(self, keys: List[str]) -> None:
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM outbox WHERE key = ?", [(k,) for k in keys])
+
+    def outbox_retry(self, key: str, delay: float, error: str = "") -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_try = ?, last_error = ? WHERE key = ?",
+                (time.time() + delay, error[:500], key),
+            )
+
+    def outbox_park(self, key: str, error: str = "") -> None:
+        """
+        Сервер окончательно не принимает запись: она остаётся в локальной
+        истории и в outbox (с last_error), но больше не отправляется.
+        """
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE outbox SET attempts = attempts + 1, parked = 1, last_error = ? WHERE key = ?",
+                (error[:500], key),
+            )
+
+    def outbox_count(self) -> int:
+        """Сколько записей ещё ждёт отправки (без отложенных навсегда)."""
+        with self._lock:
+            return int(self._db.execute(
+                "SELECT COUNT(*) FROM outbox WHERE username = ? AND parked = 0", (self.username,)
+            ).fetchone()[0])
+
+    def outbox_next_try(self) -> Optional[float]:
+        with self._lock:
+            return self._db.execute(
+                "SELECT MIN(next_try) FROM outbox WHERE username = ? AND parked = 0", (self.username,)
+            ).fetchone()[0]
+
+    def _upsert_synced(self, rows: List[tuple]) -> None:
+        # вызывается под self._lock в транзакции
+        self._db.executemany(_DROP_LOCAL_COPY, [(self.username, r[-1]) for r in rows if r[-1]])
+        self._db.executemany(_UPSERT, rows)
+
+    def merge(self, records: List[Dict[str, Any]]) -> None:
+        rows = [r for r in (_row(self.username, x) for x in records if isinstance(x, dict)) if r]
+        with self._lock, self._db:
+            self._upsert_synced(rows)
+
+    def replace_synced(self, records: List[Dict[str, Any]]) -> None:
+        """
+        Полная история с сервера: записи, которых там больше нет (например,
+        после сброса статистики), удаляются. Из локальных записей без
+        server_id остаются только ждущие отправки в outbox: уже отправленная
+        запись есть в полной истории, и если она не совпала ни по ключу,
+        ни по ts, это та же запись, которую сервер вернул в другом виде.
+        """
+        rows = [r for r in (_row(self.username, x) for x in records if isinstance(x, dict)) if r]
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM training WHERE username = ? AND server_id IS NOT NULL", (self.username,))
+            self._upsert_synced(rows)
+            self._db.execute(
+                "DELETE FROM training WHERE username = ? AND server_id IS NULL AND client_key IS NOT NULL "
+                "AND client_key NOT IN (SELECT key FROM outbox WHERE username = ?)",
+                (self.username, self.username),
+            )
+
+    def clear(self) -> None:
+        """Сброс статистики: вместе с историей удаляется и очередь на отправку."""
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM training WHERE username = ?", (self.username,))
+            self._db.execute("DELETE FROM outbox WHERE username = ?", (self.username,))
+
+    def records(self, limit: int = 2000) -> List[Dict[str, Any]]:
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT * FROM (SELECT ts, user_stage, ai_stage, score, dice, p_max, server_id AS id "
+                "FROM training WHERE username = ? ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+                (self.username, int(limit)),
+            )
+            return [dict(r) for r in cur.fetchall()]
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            r = self._db.execute(
+                "SELECT COUNT(*) AS total, AVG(score) AS avg_score, AVG(dice) AS avg_dice, MAX(ts) AS last_ts "
+                "FROM training WHERE username = ?",
+                (self.username,),
+            ).fetchone()
+        return {
+            "total": int(r["total"] or 0),
+            "avg_score": float(r["avg_score"] or 0.0),
+            "avg_dice": float(r["avg_dice"] or 0.0),
+            "last_ts": r["last_ts"],
+        }
+
+    def recent_scores(self, limit: int = 50) -> List[int]:
+        with self._lock:
+            cur = self._db.execute(
+                "SELECT score FROM (SELECT score, ts FROM training WHERE username = ? ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+                (self.username, int(limit)),
+            )
+            return [int(r[0]) for r in cur.fetchall()]
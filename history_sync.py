@@ -0,0 +1,122 @@
+# history_sync.py
+"""
+Инкрементальная синхронизация истории тренировок.
+
+Локальная копия хранится в памяти. Каждый sync() запрашивает только записи
+новее последнего виденного id/ts. Если сервер курсор не поддерживает и
+вернул полный список (в нём есть уже виденные записи), ответ просто
+заменяет локальную копию — это и есть полная загрузка.
+
+Если передан HistoryStore, копия стартует с уже сохранённых серверных
+записей (курсор переживает перезапуск), а изменения пишутся в SQLite.
+"""
+import threading
+from typing import Any, Dict, List, Optional
+
+from api_client import get_training_history
+from history_store import HistoryStore
+
+
+def _rec_key(r: Dict[str, Any]):
+    if r.get("id") is not None:
+        return ("id", r.get("id"))
+    return ("ts", r.get("ts"), r.get("user_stage"), r.get("ai_stage"), r.get("score"))
+
+
+class HistorySync:
+    def __init__(self, limit: int = 2000, store: Optional[HistoryStore] = None):
+        self.limit = int(limit)
+        self.store = store
+        self._records: List[Dict[str, Any]] = []
+        self._keys: set = set()
+        self._loaded = False
+        self._gen = 0          # меняется при reset(): ответ старого запроса не применяется
+        self._lock = threading.Lock()
+        self.supports_since: Optional[bool] = None
+        if store is not None:
+            synced = [r for r in store.records(self.limit) if r.get("id") is not None]
+            if synced:
+                self._replace(synced)
+
+    @property
+    def records(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._records)
+
+    def _cursor(self):
+        max_id = None
+        max_ts = None
+        for r in self._records:
+            rid = r.get("id")
+            if isinstance(rid, int) and (max_id is None or rid > max_id):
+                max_id = rid
+            ts = r.get("ts")
+            if ts and (max_ts is None or str(ts) > max_ts):
+                max_ts = str(ts)
+        return max_id, max_ts
+
+    def _replace(self, data: List[Dict[str, Any]]):
+        data = [r for r in data if isinstance(r, dict)]
+        data.sort(key=lambda r: str(r.get("ts") or ""))
+        self._records = data[-self.limit:]
+        self._keys = {_rec_key(r) for r in self._records}
+        self._loaded = True
+
+    def _save(self, data: Optional[List[Dict[str, Any]]] = None, full: bool = False):
+        if self.store is None:
+            return
+        if full:
+            self.store.replace_synced(self._records)
+        else:
+            self.store.merge(data or [])
+
+    def sync(self) -> bool:
+        """
+        Возвращает True, если локальная копия изменилась.
+        Блокировка не держится во время запроса: reset() из потока GUI не
+        ждёт сеть. Ответ, пришедший после reset(), отбрасывается.
+        """
+        with self._lock:
+            gen = self._gen
+            full = not self._loaded or self.supports_since is False
+            since_id, since_ts = (None, None) if full else self._cursor()
+
+        if full:
+            data = get_training_history(self.limit)
+        else:
+            data = get_training_history(self.limit, since_id=since_id, since_ts=since_ts)
+        data = [r for r in data if isinstance(r, dict)]
+
+        with self._lock:
+            if gen != self._gen:
+                return False
+            if full:
+                return self._replace_full(data)
+            if not data:
+                return False
+
+            if any(_rec_key(r) in self._keys for r in data):
+                # сервер проигнорировал курсор и отдал всю историю
+                self.supports_since = False
+                return self._replace_full(data)
+
+            self.supports_since = True
+            self._replace(self._records + data)
+            self._save(data)
+            return True
+
+    def _replace_full(self, data: List[Dict[str, Any]]) -> bool:
+        # вызывается под self._lock
+        before = [_rec_key(r) for r in self._records]
+        self._replace(data)
+        self._save(full=True)
+        return [_rec_key(r) for r in self._records] != before
+
+    def reset(self):
+        with self._lock:
+            self._gen += 1
+            self._records = []
+            self._keys = set()
+            self._loaded = False
+            if self.store is not None:
+                self.store.clear()
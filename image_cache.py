@@ -0,0 +1,101 @@
+# image_cache.py
+"""
+Общий LRU-кэш в памяти для страницы обучения и слоя инференса.
+
+Хранит декодированные RGB-снимки, подготовленные тензоры 224x224 и
+результаты анализа. Ограничение задаётся в байтах, а не в числе записей:
+один 4K снимок весит как сотня тензоров.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def _nbytes(value) -> int:
+    if isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    if isinstance(value, dict):
+        return 64 + sum(_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        return 64 + sum(_nbytes(v) for v in value)
+    return 64
+
+
+class ByteLRUCache:
+    def __init__(self, max_bytes: int):
+        self.max_bytes = int(max_bytes)
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, nbytes: int | None = None):
+        size = _nbytes(value) if nbytes is None else int(nbytes)
+        if size > self.max_bytes:
+            return value
+        if isinstance(value, np.ndarray):
+            # значения разделяются между потребителями — правка на месте запрещена
+            value.flags.writeable = False
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._data[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes and self._data:
+                _, (_, sz) = self._data.popitem(last=False)
+                self._bytes -= sz
+        return value
+
+    def get_or_create(self, key, factory):
+        value = self.get(key)
+        if value is None:
+            value = factory()
+            if value is not None:
+                value = self.put(key, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def file_key(kind: str, path: str, *extra) -> tuple:
+    """Ключ, который устаревает вместе с файлом (путь + размер + mtime)."""
+    st = os.stat(path)
+    return (kind, os.path.abspath(path), st.st_size, st.st_mtime_ns) + extra
+
+
+_shared: ByteLRUCache | None = None
+_shared_lock = threading.Lock()
+def shared() -> ByteLRUCache:
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            mb = int(os.environ.get("RETINO_CACHE_MB", "256"))
+            _shared = ByteLRUCache(mb * 1024 * 1024)
+    return _shared
@@ -4,21 +4,10 @@ import sys
 import json
 import numpy as np
 import cv2
-
-def imread_unicode(path: str):
-    data = np.fromfile(path, dtype=np.uint8)
-    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
-    return img
+from preprocess import load_batch
 
 def preprocess(image_path: str, size=224):
-    bgr = imread_unicode(image_path)
-    if bgr is None:
-        raise RuntimeError("Не удалось прочитать изображение")
-    rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-    rgb = cv2.resize(rgb, (size, size), interpolation=cv2.INTER_AREA)
-    x = rgb.astype(np.float32) / 255.0
-    x = np.transpose(x, (2, 0, 1))[None, ...] 
-    return x
+    return load_batch([image_path], size)
 
 def main():
     if len(sys.argv) < 3:
@@ -28,12 +17,16 @@ def main():
     image_path = sys.argv[1]
     out_png = sys.argv[2]
 
-    os.environ.setdefault("OMP_NUM_THREADS", "1")
     os.environ.setdefault("KMP_DUPLICATE_LIB_OK", "TRUE")
 
     import torch
     import timm
     import torch.nn.functional as F
+    import runtime_config
+
+    torch_threads = int(runtime_config.load().get("torch_threads", 0))
+    if torch_threads > 0:
+        torch.set_num_threads(torch_threads)
 
     models_dir = "models"
     pt_path = os.path.join(models_dir, "best_cls.pt")
@@ -0,0 +1,126 @@
+import itertools
+import queue
+
+from PyQt5 import QtCore
+
+import heatmap_cache
+import image_cache
+import ml_local
+
+
+class InferenceService(QtCore.QThread):
+    """
+    Долгоживущий поток инференса: модель грузится один раз (ml_local.get_model)
+    и обслуживает все запросы, вместо запуска infer_torch.py на каждый клик.
+    """
+    done = QtCore.pyqtSignal(int, dict)   # job_id, результат
+    fail = QtCore.pyqtSignal(int, str)    # job_id, ошибка
+    state_changed = QtCore.pyqtSignal(str, str)  # "idle" | "loading" | "ready" | "error", текст ошибки
+
+    def __init__(self):
+        super().__init__()
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self.state = "idle"
+
+    def _set_state(self, state: str, msg: str = ""):
+        self.state = state
+        self.state_changed.emit(state, msg)
+
+    def preload(self):
+        """
+        Загрузка модели и прогревочный проход в фоне, чтобы первый анализ
+        был таким же быстрым, как и последующие.
+        """
+        if self.state in ("loading", "ready"):
+            return
+        self.state = "loading"
+        self._queue.put((0, None))
+        if not self.isRunning():
+            self.start()
+
+    def submit(self, image_path: str) -> int:
+        job_id = next(self._ids)
+
+        cached = self._cached(image_path)
+        if cached is not None:
+            QtCore.QTimer.singleShot(0, lambda: self.done.emit(job_id, cached))
+            return job_id
+
+        self._queue.put((job_id, image_path))
+        if not self.isRunning():
+            self.start()
+        return job_id
+
+    def _cached(self, image_path: str) -> dict | None:
+        # в потоке GUI — только кэш в памяти; дисковый (хэши моделей и
+        # снимка, чтение npz) проверяется в run()
+        try:
+            return image_cache.shared().get(image_cache.file_key("infer", image_path))
+        except OSError:
+            return None
+
+    def _disk_cached(self, image_path: str) -> dict | None:
+        try:
+            data = heatmap_cache.lookup(image_path)
+            if data is not None:
+                image_cache.shared().put(image_cache.file_key("infer", image_path), data)
+            return data
+        except OSError:
+            return None
+
+    def stop(self):
+        if self.isRunning():
+            self._queue.put(None)
+            self.wait()
+
+    def run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job_id, image_path = job
+            if image_path is None:
+                self._warmup()
+                continue
+            cached = self._disk_cached(image_path)
+            if cached is not None:
+                self.done.emit(job_id, cached)
+                continue
+            try:
+                data = ml_local.get_model().infer(image_path)
+                if self.state != "ready":
+                    self._set_state("ready")
+                self.done.emit(job_id, data)
+                try:
+                    image_cache.shared().put(image_cache.file_key("infer", image_path), data)
+                    heatmap_cache.store(image_path, data)
+                except Exception:
+                    pass
+            except Exception as e:
+                self.fail.emit(job_id, str(e))
+
+    def _warmup(self):
+        self._set_state("loading")
+        try:
+            ml_local.autotune_if_needed()
+        except Exception:
+            # подбор потоков — не обязателен (например, каталог установки
+            # только для чтения): остаёмся на настройках по умолчанию
+            pass
+        try:
+            ml_local.get_model().warmup()
+            self._set_state("ready")
+        except Exception as e:
+            self._set_state("error", str(e))
+
+
+_service: InferenceService | None = None
+def get_service() -> InferenceService:
+    global _service
+    if _service is None:
+        _service = InferenceService()
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(_service.stop)
+    return _service
@@ -2,6 +2,7 @@ from PyQt5 import QtWidgets, QtCore
 from api_client import authenticate_user
 from api_client import get_maintenance_status
 from ui_dialogs import RoundedDialog
+import task_pool
 
 class LoginWindow(QtWidgets.QWidget):
     def __init__(self, on_success, on_open_register):
@@ -102,6 +103,7 @@ class LoginWindow(QtWidgets.QWidget):
         login_button.setStyleSheet(self.button_style("#0078D7"))
         login_button.clicked.connect(self.login)
         layout.addWidget(login_button)
+        self.login_button = login_button
 
         register_label = QtWidgets.QLabel('Нет аккаунта? <a href="#">Создайте новый</a>!')
         register_label.setAlignment(QtCore.Qt.AlignCenter)
@@ -148,16 +150,32 @@ class LoginWindow(QtWidgets.QWidget):
             RoundedDialog.warning("Ошибка", "Одно из полей данных вашего аккаунта пустует.\nПожалуйста, заполните все поля до конца!")
             return
 
+        # сеть — в фоне, окно не замирает на холодном старте сервера
+        self._set_busy(True)
+        t = task_pool.run("auth", self._login_request, username, password)
+        t.ok.connect(lambda res: self._on_login_result(username, res))
+        t.fail.connect(lambda _: self._on_login_result(username, ("denied", None)))
+
+    def _set_busy(self, busy: bool):
+        self.login_button.setEnabled(not busy)
+        self.login_button.setText("Вход…" if busy else "Войти")
+
+    @staticmethod
+    def _login_request(username: str, password: str):
         try:
             st = get_maintenance_status()
             if st.get("enabled"):
-                msg = st.get("message") or "Ведутся технические работы. Доступ запрещён."
-                RoundedDialog.warning("Технические работы", "Сообщение от сервера: " + msg + "\n\nСейчас в приложении ведутся технические работы. В этот момент просмотр контента приложения, его использование или любые другие действия в нём недоступны. Приносим свои извенения, за доставленные неудобства!")
-                return
+                return "maintenance", st.get("message") or "Ведутся технические работы. Доступ запрещён."
         except Exception:
             pass
-
-        if authenticate_user(username, password):
+        return ("ok", None) if authenticate_user(username, password) else ("denied", None)
+
+    def _on_login_result(self, username: str, res):
+        self._set_busy(False)
+        status, msg = res
+        if status == "maintenance":
+            RoundedDialog.warning("Технические работы", "Сообщение от сервера: " + msg + "\n\nСейчас в приложении ведутся технические работы. В этот момент просмотр контента приложения, его использование или любые другие действия в нём недоступны. Приносим свои извенения, за доставленные неудобства!")
+        elif status == "ok":
             RoundedDialog.info("Успешно", "Вы успешно авторизовались в своём аккаунте!")
             self.on_success(username)
             self.close()
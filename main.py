@@ -61,6 +61,9 @@ class AppController:
             self.login_window.close()
             self.login_window = None
 
+        from inference_service import get_service
+        get_service().preload()
+
         from main_window import MainWindow
         self.main_window = MainWindow(username, on_logout=self.show_login)
         self.main_window.show()
@@ -1,20 +1,26 @@
 import os
-import sys
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
-os.environ["OMP_NUM_THREADS"] = "1"
 from PyQt5 import QtWidgets, QtCore, QtGui
-from api_client import delete_user_soft, logout, get_maintenance_status, get_updates, save_training_record, get_training_history, reset_training_history
+from api_client import delete_user_soft, logout, reset_training_history
 from ui_dialogs import DeleteAccountDialog, RoundedDialog
-from ui_dialogs import ApiWorker
+import api_async
+import task_pool
+from history_sync import HistorySync
+from history_store import HistoryStore
+from training_outbox import TrainingOutbox
+from stroke_mask import StrokeMask
 import numpy as np
 import datetime
 import cv2
-import json
 import random
-import subprocess
-import tempfile
+import uuid
+import time
 import datetime
 from main import current_v
+from inference_service import get_service
+import preprocess
+import image_cache
+import hashlib
 class LineChartWidget(QtWidgets.QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -91,6 +97,14 @@ class LineChartWidget(QtWidgets.QWidget):
             p.drawLine(int(r.left()), int(y), int(r.right()), int(y))
 
 class MainWindow(QtWidgets.QWidget):
+    # опрос тех. работ, секунды
+    MAINT_POLL_BASE = 15
+    MAINT_POLL_MAX = 120         # ответ сервера долго не меняется
+    MAINT_POLL_HIDDEN = 300      # окно свёрнуто или скрыто
+    MAINT_POLL_IDLE = 90         # пользователь давно ничего не делал
+    MAINT_POLL_NEAR = 5          # рядом с объявленным началом работ
+    IDLE_AFTER = 300
+
     def __init__(self, username: str, on_logout):
         super().__init__()
         self._account_verified = True
@@ -98,6 +112,17 @@ class MainWindow(QtWidgets.QWidget):
         self.on_logout = on_logout
 
         self.old_pos = None
+        self._updates_layout = None
+        self._store = HistoryStore(self._stats_path(), username)
+        self._history = HistorySync(limit=2000, store=self._store)
+        self._outbox = TrainingOutbox(self._store)
+        self._stats_task = None
+        self._maint_task = None
+        self._maint_forced = False
+        self._maint_last = None
+        self._maint_interval = self.MAINT_POLL_BASE
+        self._maint_near = False
+        self._last_input = time.monotonic()
 
         self.setWindowTitle("RetinopatiaApp")
         self.setFixedSize(1200, 760)
@@ -106,17 +131,21 @@ class MainWindow(QtWidgets.QWidget):
 
         self._build_ui()
 
-        self._maint_forced = False
+        self._outbox.pending_changed.connect(self._on_outbox_pending)
+        self._on_outbox_pending(self._outbox.pending())
+        self._outbox.kick()
+
         self._maint_timer = QtCore.QTimer(self)
+        self._maint_timer.setSingleShot(True)
         self._maint_timer.timeout.connect(self._check_maintenance)
-        self._maint_timer.start(15000)
+        self._maint_timer.start(self.MAINT_POLL_BASE * 1000)
+        QtWidgets.QApplication.instance().installEventFilter(self)
 
         self._stats_timer = QtCore.QTimer(self)
         self._stats_timer.timeout.connect(self._refresh_stats_and_home)
         self._stats_timer.start(20000) 
 
         self._account_status = {"is_verified": False, "email": None}
-        self._updates_layout = None
     
     def _ru_plural(self, n: int, one: str, few: str, many: str) -> str:
         n = abs(int(n))
@@ -156,13 +185,71 @@ class MainWindow(QtWidgets.QWidget):
         days = hours // 24
         return f"{days} {self._ru_plural(days, 'день', 'дня', 'дней')} назад"
 
+    def _sync_history(self) -> bool:
+        # False — ничего не изменилось, пересчитывать статистику не нужно
+        return self._history.sync()
+
     def _refresh_stats_and_home(self):
-        w = ApiWorker(get_training_history, 2000)
-        w.ok.connect(self._apply_stats_data)
-        w.fail.connect(lambda _: self._apply_stats_data([]))
-        w.finished.connect(w.deleteLater)
-        w.start()
-        self._stats_worker = w
+        if task_pool.shared().busy("history"):
+            return
+        t = task_pool.run("history", self._sync_history)
+        t.ok.connect(lambda changed: changed and self._apply_stats_data())
+        self._stats_task = t
+
+    def _apply_stats_data(self):
+        s = self._store.summary()
+        total = s["total"]
+        avg_score = s["avg_score"]
+        avg_dice = s["avg_dice"]
+        last_ts = s["last_ts"]
+
+        self.home_total_lbl.setText(str(total) if total else "—")
+        self.home_eff_lbl.setText(f"{avg_score / 5 * 100:.0f}%" if total else "—%")
+        self.home_last_activity_lbl.setText(self._format_ago(last_ts) if last_ts else "—")
+
+        self.stats_total_lbl.setText(str(total) if total else "—")
+        self.stats_avg_score_lbl.setText(f"{avg_score:.1f}/5" if total else "—/5")
+        self.stats_avg_dice_lbl.setText(f"{avg_dice:.2f}" if total else "—")
+
+        scores = self._store.recent_scores(50)
+        best, cur = [], 0
+        for v in scores:
+            cur = max(cur, v)
+            best.append(cur)
+        self.stats_chart.set_series(scores, best)
+
+    def _apply_updates_home(self, updates: list):
+        il = self._updates_layout
+        if il is None:
+            return
+        while il.count():
+            item = il.takeAt(0)
+            if item.widget() is not None:
+                item.widget().deleteLater()
+
+        updates = [u for u in (updates or []) if isinstance(u, dict)]
+        updates.sort(key=lambda u: int(u.get("id", 0) or 0), reverse=True)
+
+        if not updates:
+            empty = QtWidgets.QLabel("Нет новостей об обновлениях.")
+            empty.setStyleSheet("QLabel { font-size: 12px; color: #777; padding: 10px; }")
+            il.addWidget(empty)
+
+        for u in updates:
+            ver = str(u.get("version", "") or "").strip()
+            title = str(u.get("title", "") or "").strip()
+            text = str(u.get("text") or u.get("description") or u.get("message") or "").strip()
+
+            head = QtWidgets.QLabel(" • ".join(x for x in (ver, title) if x))
+            head.setStyleSheet("QLabel { font-size: 13px; font-weight: 800; color: #222; }")
+            il.addWidget(head)
+            if text:
+                body = QtWidgets.QLabel(text)
+                body.setWordWrap(True)
+                body.setStyleSheet("QLabel { font-size: 12px; color: #555; padding-bottom: 6px; }")
+                il.addWidget(body)
+
+        il.addStretch(1)
 
     def _on_maint_ok(self, st: dict):
         if st.get("enabled"):
@@ -177,21 +264,94 @@ class MainWindow(QtWidgets.QWidget):
             self.close()
             if self.on_logout:
                 self.on_logout()
+            return
+        self._maint_schedule(st)
 
     def _check_maintenance(self):
         if self._maint_forced:
             return
 
-        from api_client import get_maintenance_status
-        from ui_dialogs import ApiWorker  # куда положишь класс
+        from api_client import get_maintenance_status, invalidate_cache
 
-        w = ApiWorker(get_maintenance_status)
-        w.ok.connect(self._on_maint_ok)
-        w.fail.connect(lambda _: None)
-        w.finished.connect(w.deleteLater)
-        w.start()
+        if task_pool.shared().busy("maintenance"):
+            self._maint_schedule()
+            return
+        if self._maint_near:
+            # у ответа свой TTL в api_client; перед началом работ он слишком длинный
+            invalidate_cache("maintenance")
+        t = task_pool.run("maintenance", get_maintenance_status)
+        t.ok.connect(self._on_maint_ok)
+        t.fail.connect(lambda _: self._maint_schedule(failed=True))
+        self._maint_task = t
+
+    @staticmethod
+    def _maint_start_ts(st) -> float | None:
+        """Время объявленного начала работ (если сервер его сообщает)."""
+        if not isinstance(st, dict):
+            return None
+        raw = st.get("starts_at") or st.get("scheduled_at") or st.get("start")
+        if not raw:
+            return None
+        try:
+            t = datetime.datetime.fromisoformat(str(raw).replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        return t.timestamp()
 
-        self._maint_worker = w  
+    def _maint_schedule(self, st: dict | None = None, failed: bool = False):
+        """
+        Следующий опрос тех. работ: интервал растёт, пока ответ не меняется,
+        окно скрыто или пользователь бездействует, и сжимается до
+        MAINT_POLL_NEAR рядом с объявленным началом работ.
+        """
+        if self._maint_forced:
+            return
+        if st is not None:
+            if st == self._maint_last:
+                self._maint_interval = min(self.MAINT_POLL_MAX, self._maint_interval * 1.5)
+            else:
+                self._maint_interval = self.MAINT_POLL_BASE
+            self._maint_last = st
+        elif failed:
+            self._maint_interval = min(self.MAINT_POLL_MAX, self._maint_interval * 2)
+
+        interval = self._maint_interval
+        if not self.isVisible() or self.isMinimized():
+            interval = max(interval, self.MAINT_POLL_HIDDEN)
+        elif time.monotonic() - self._last_input > self.IDLE_AFTER:
+            interval = max(interval, self.MAINT_POLL_IDLE)
+
+        self._maint_near = False
+        start = self._maint_start_ts(self._maint_last)
+        if start is not None:
+            left = start - time.time()
+            if left > -self.MAINT_POLL_MAX:
+                # к началу работ подходим шагами по четверти оставшегося времени
+                interval = min(interval, max(self.MAINT_POLL_NEAR, left / 4))
+                self._maint_near = interval <= self.MAINT_POLL_BASE
+
+        self._maint_timer.start(int(interval * 1000))
+
+    def _maint_wake(self):
+        # окно снова активно: не ждать длинного интервала
+        if self._maint_forced or self._maint_task is not None and not self._maint_task.done():
+            return
+        if self._maint_timer.remainingTime() > self.MAINT_POLL_BASE * 1000:
+            self._maint_interval = self.MAINT_POLL_BASE
+            self._maint_timer.start(1000)
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QtCore.QEvent.MouseButtonPress, QtCore.QEvent.KeyPress, QtCore.QEvent.Wheel):
+            idle = time.monotonic() - self._last_input > self.IDLE_AFTER
+            self._last_input = time.monotonic()
+            if idle:
+                self._maint_wake()
+        return False
+
+    def changeEvent(self, event):
+        if event.type() == QtCore.QEvent.WindowStateChange and not self.isMinimized():
+            self._maint_wake()
+        super().changeEvent(event)
 
     def _build_ui(self):
         wrapper = QtWidgets.QWidget(self)
@@ -300,6 +460,12 @@ class MainWindow(QtWidgets.QWidget):
 
         side_layout.addStretch(1)
 
+        self.outbox_lbl = QtWidgets.QLabel("")
+        self.outbox_lbl.setWordWrap(True)
+        self.outbox_lbl.setStyleSheet("QLabel { font-size: 11px; color: #a86400; font-weight: 700; padding: 0 6px; }")
+        self.outbox_lbl.hide()
+        side_layout.addWidget(self.outbox_lbl)
+
         line = QtWidgets.QFrame()
         line.setFixedHeight(1)
         line.setStyleSheet("background-color: #e6e6e6;")
@@ -340,8 +506,35 @@ class MainWindow(QtWidgets.QWidget):
         body.addWidget(sidebar)
         body.addWidget(content, 1)
         root.addLayout(body)
-        QtCore.QTimer.singleShot(0, self._refresh_stats_and_home)
-        self._check_update()
+        # локальная история доступна сразу и без сети
+        self._apply_stats_data()
+        self._startup_fetch()
+
+    def _startup_fetch(self):
+        # история, обновления и тех. работы запрашиваются параллельно
+        r = api_async.run_qt(api_async.gather_settled(
+            history=api_async.call_kind("history", self._sync_history),
+            updates=api_async.get_updates(),
+            maintenance=api_async.get_maintenance_status(),
+        ))
+        r.ok.connect(self._on_startup_data)
+        self._startup_req = r
+
+    def _on_startup_data(self, res: dict):
+        ok, st = res.get("maintenance", (False, None))
+        if ok and isinstance(st, dict):
+            self._on_maint_ok(st)
+            if self._maint_forced:
+                return
+
+        ok, changed = res.get("history", (False, False))
+        if ok and changed:
+            self._apply_stats_data()
+
+        ok, updates = res.get("updates", (False, None))
+        updates = updates if ok else []
+        self._apply_updates_home(updates)
+        self._check_update(updates)
 
     def _ver_tuple(self, v: str):
         s = (v or "").strip().lower()
@@ -360,9 +553,8 @@ class MainWindow(QtWidgets.QWidget):
             nums.append(0)
         return tuple(nums[:3])
 
-    def _check_update(self):
+    def _check_update(self, updates: list):
         try:
-            updates = get_updates()
             if not updates:
                 return
 
@@ -419,29 +611,33 @@ class MainWindow(QtWidgets.QWidget):
 
     def _stats_path(self) -> str:
         base = os.path.dirname(os.path.abspath(__file__))
-        return os.path.join(base, "training_history.json")
-
-    def _stats_load(self) -> list:
-        try:
-            return get_training_history(limit=2000) or []
-        except Exception:
-            return []
+        return os.path.join(base, "training_history.sqlite3")
 
     def _stats_append(self, rec: dict):
         import datetime
         rec = dict(rec)
         ts = datetime.datetime.now().isoformat(timespec="seconds")
-        try:
-            save_training_record(
-                user_stage=rec.get("user_stage", 0),
-                ai_stage=rec.get("ai_stage", 0),
-                score=rec.get("score", 0),
-                dice=rec.get("dice", 0.0),
-                p_max=rec.get("p_max", 0.0),
-                ts=ts,
-            )
-        except Exception:
-            pass
+        rec["ts"] = ts
+        # запись сразу в локальную базу и очередь, отправка — в фоне
+        self._store.add(rec, outbox_key=uuid.uuid4().hex)
+        self._apply_stats_data()
+        self._outbox.kick()
+
+    def _on_outbox_pending(self, n: int):
+        if n:
+            self.outbox_lbl.setText(f"Не отправлено на сервер: {n} "
+                                    f"{self._ru_plural(n, 'результат', 'результата', 'результатов')}")
+        self.outbox_lbl.setVisible(bool(n))
+
+    def closeEvent(self, event):
+        # очередь остаётся в базе и уйдёт при следующем входе этого пользователя
+        self._outbox.stop()
+        self._maint_timer.stop()
+        QtWidgets.QApplication.instance().removeEventFilter(self)
+        for t in (self._stats_task, self._maint_task):
+            if t is not None:
+                t.cancel()
+        super().closeEvent(event)
 
     def _page_home(self) -> QtWidgets.QWidget:
         w = QtWidgets.QWidget()
@@ -693,13 +889,6 @@ class MainWindow(QtWidgets.QWidget):
         loading.setStyleSheet("QLabel { font-size: 12px; color: #777; padding: 10px; }")
         il.addWidget(loading)
 
-        w = ApiWorker(get_updates)
-        w.ok.connect(self._apply_updates_home)
-        w.fail.connect(lambda _: self._apply_updates_home([]))
-        w.finished.connect(w.deleteLater)
-        w.start()
-        self._updates_worker = w
-
         il.addStretch(1)
         scroll.setWidget(inner)
         # scroll.setFixedHeight(170)
@@ -719,7 +908,6 @@ class MainWindow(QtWidgets.QWidget):
         title = QtWidgets.QLabel("Статистика")
         title.setStyleSheet("font-size: 22px; font-weight: 800; color: #222;")
         l.addWidget(title)
-        data = self._stats_load()
 
         cards = QtWidgets.QHBoxLayout()
         cards.setSpacing(14)
@@ -754,10 +942,6 @@ class MainWindow(QtWidgets.QWidget):
             cl.addWidget(hh)
             return c, vv
 
-        total = len(data)
-        avg_score = (sum(d.get("score", 0) for d in data) / total) if total else 0.0
-        avg_dice = (sum(d.get("dice", 0.0) for d in data) / total) if total else 0.0
-
         c1, self.stats_total_lbl = card("Проведено тренировок", "—", "Количество решённых заданий")
         c2, self.stats_avg_score_lbl = card("QWS", "—/5", "Средняя оценка качества ваших знаний")
         c3, self.stats_avg_dice_lbl = card("AIS", "—", "Соответствие с областью внимания")
@@ -812,33 +996,23 @@ class MainWindow(QtWidgets.QWidget):
             "4 стадия - Профилеративная"
         ]
 
-        def _imread_unicode(path: str):
-            data = np.fromfile(path, dtype=np.uint8)
-            img = cv2.imdecode(data, cv2.IMREAD_COLOR)
-            return img
-
         def _np_rgb_to_qpix(rgb: np.ndarray) -> QtGui.QPixmap:
             h, w = rgb.shape[:2]
             qimg = QtGui.QImage(rgb.data, w, h, 3 * w, QtGui.QImage.Format_RGB888)
             return QtGui.QPixmap.fromImage(qimg.copy())
 
-        def _blend_heatmap_on_rgb(rgb: np.ndarray, heat: np.ndarray, alpha: float = 0.35) -> np.ndarray:
-            heat_u8 = (heat * 255).astype(np.uint8)
-            heat_color = cv2.applyColorMap(heat_u8, cv2.COLORMAP_JET)  # BGR
-            heat_color = cv2.cvtColor(heat_color, cv2.COLOR_BGR2RGB)
-            heat_color = cv2.resize(heat_color, (rgb.shape[1], rgb.shape[0]), interpolation=cv2.INTER_LINEAR)
-            out = rgb.astype(np.float32) * (1 - alpha) + heat_color.astype(np.float32) * alpha
-            return np.clip(out, 0, 255).astype(np.uint8)
-
-        def _overlay_user_mask(rgb: np.ndarray, mask01: np.ndarray, alpha: float = 0.30) -> np.ndarray:
-            if mask01 is None:
-                return rgb
-            m = cv2.resize(mask01, (rgb.shape[1], rgb.shape[0]), interpolation=cv2.INTER_NEAREST)
-            m = (m > 0.5).astype(np.float32)[..., None]
-            green = np.zeros_like(rgb, dtype=np.float32)
-            green[..., 1] = 255.0
-            out = rgb.astype(np.float32) * (1 - alpha * m) + green * (alpha * m)
-            return np.clip(out, 0, 255).astype(np.uint8)
+        def _colorize_heatmap(heat: np.ndarray, w: int, h: int) -> np.ndarray:
+            # раскрашенный слой кэшируется по (карта, размер): смена размера
+            # туда-обратно и повторный показ карты его не пересчитывают
+            digest = hashlib.sha1(np.ascontiguousarray(heat).tobytes()).hexdigest()
+
+            def build():
+                heat_u8 = (heat * 255).astype(np.uint8)
+                heat_color = cv2.applyColorMap(heat_u8, cv2.COLORMAP_JET)  # BGR
+                heat_color = cv2.cvtColor(heat_color, cv2.COLOR_BGR2RGB, dst=heat_color)
+                return cv2.resize(heat_color, (w, h), interpolation=cv2.INTER_LINEAR)
+
+            return image_cache.shared().get_or_create(("heat_color", digest, w, h), build)
 
         def _dice(a: np.ndarray, b: np.ndarray) -> float:
             a = a.astype(bool)
@@ -915,87 +1089,92 @@ class MainWindow(QtWidgets.QWidget):
                     screen = QtWidgets.QApplication.primaryScreen().availableGeometry()
                     self.move(screen.center().x() - self.width() // 2, screen.center().y() - self.height() // 2)
 
-        class InferenceWorker(QtCore.QThread):
-            done = QtCore.pyqtSignal(dict)
-            fail = QtCore.pyqtSignal(str)
-
-            def __init__(self, image_path: str, out_png: str):
-                super().__init__()
-                self.image_path = image_path
-                self.out_png = out_png
-
-            def run(self):
-                try:
-                    py = sys.executable
-                    cmd = [py, "infer_torch.py", self.image_path, self.out_png]
-
-                    res = subprocess.run(
-                        cmd,
-                        capture_output=True,
-                        text=True,
-                        timeout=60  # ← ВАЖНО
-                    )
-
-                    if res.returncode != 0:
-                        err = (res.stderr or res.stdout or "").strip() or "Неизвестная ошибка"
-                        self.fail.emit(err)
-                        return
-
-                    data = json.loads(res.stdout.strip())
-                    self.done.emit(data)
-
-                except subprocess.TimeoutExpired:
-                    self.fail.emit("Превышено время ожидания анализа (60 сек).")
-                except Exception as e:
-                    self.fail.emit(str(e))
-
         class PaintCanvas(QtWidgets.QWidget):
+            """
+            Снимок, маска пользователя и тепловая карта ИИ — отдельные слои,
+            подготовленные в размере области отображения (пересобираются только
+            при смене размера или данных). paintEvent лишь накладывает их
+            QPainter'ом: маска — полупрозрачный RGBA-слой, карта — с opacity.
+
+            base_rgb и user_mask — уменьшенная копия снимка (preprocess.
+            load_display_rgb); full_size — размер оригинала. Разметка хранится
+            журналом мазков (StrokeMask): user_mask — его текущий растр, маска
+            для оценки — mask_at(), для экспорта — заново по журналу.
+            """
+            MASK_RGBA = (0, 71, 0, 71)   # зелёный, alpha 0.28 (premultiplied)
+
             def __init__(self):
                 super().__init__()
                 self.base_rgb = None
-                self.view_rgb = None
-                self.user_mask = None
+                self.strokes = None        # StrokeMask в размере base_rgb
+                self.full_size = None      # (W, H) оригинала
                 self.ai_heat = None
                 self.show_ai = False
+                self.alpha_cam = 0.33
+
+                self._layers_size = None   # (w, h) области, под которую собраны слои
+                self._base_pix = None
+                self._heat_pix = None
+                self._mask_rgba = None
+                self._mask_img = None
 
                 self.brush = 18
                 self.eraser = False
                 self.paint_enabled = False
 
                 self._dragging = False
-                self._last_pos = None
 
                 self.setMinimumSize(1, 1)
                 self.setSizePolicy(QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Expanding)
 
+            def _drop_layers(self):
+                self._layers_size = None
+                self._base_pix = None
+                self._heat_pix = None
+                self._mask_rgba = None
+                self._mask_img = None
+
+            @property
+            def user_mask(self):
+                return self.strokes.mask if self.strokes is not None else None
+
             def clear_all(self):
                 self.base_rgb = None
-                self.view_rgb = None
-                self.user_mask = None
+                self.strokes = None
+                self.full_size = None
                 self.ai_heat = None
                 self.show_ai = False
                 self.paint_enabled = False
+                self._drop_layers()
                 self.update()
 
-            def set_image(self, rgb: np.ndarray):
+            def set_image(self, rgb: np.ndarray, full_size=None):
                 self.base_rgb = rgb
-                self.user_mask = np.zeros((rgb.shape[0], rgb.shape[1]), dtype=np.uint8)
+                self.full_size = tuple(full_size) if full_size else (rgb.shape[1], rgb.shape[0])
+                self.strokes = StrokeMask(rgb.shape[1], rgb.shape[0])
                 self.ai_heat = None
                 self.show_ai = False
-                self._recompose(alpha_cam=0.33)
+                self._drop_layers()
                 self.update()
 
             def set_ai_heat(self, heat224: np.ndarray, alpha_cam: float):
                 self.ai_heat = heat224
+                self.alpha_cam = alpha_cam
                 self.show_ai = True
-                self._recompose(alpha_cam=alpha_cam)
+                self._heat_pix = None
                 self.update()
 
             def set_show_ai(self, flag: bool, alpha_cam: float):
                 self.show_ai = bool(flag)
-                self._recompose(alpha_cam=alpha_cam)
+                self.alpha_cam = alpha_cam
                 self.update()
 
+            def set_alpha(self, alpha_cam: float):
+                # смешивание делает QPainter при отрисовке, слои не пересобираются
+                self.alpha_cam = max(0.0, min(1.0, float(alpha_cam)))
+                if self.show_ai:
+                    self.update()
+
             def set_brush(self, v: int):
                 self.brush = max(3, int(v))
 
@@ -1006,17 +1185,79 @@ class MainWindow(QtWidgets.QWidget):
                 self.paint_enabled = bool(flag)
 
             def has_user_paint(self) -> bool:
-                return self.user_mask is not None and int(self.user_mask.sum()) > 0
+                return self.user_mask is not None and bool(self.user_mask.any())
+
+            def _brush_px(self) -> int:
+                # размер кисти задан в пикселях оригинала
+                return max(1, int(round(self.brush * self.base_rgb.shape[1] / self.full_size[0])))
+
+            def mask_at(self, size) -> np.ndarray:
+                """Маска пользователя (uint8 0/1) в размере size=(w, h)."""
+                if tuple(size) == (self.user_mask.shape[1], self.user_mask.shape[0]):
+                    return self.user_mask.copy()
+                return cv2.resize(self.user_mask, tuple(size), interpolation=cv2.INTER_NEAREST)
+
+            def export_mask(self) -> np.ndarray:
+                """Маска в разрешении оригинального снимка (растеризуется по журналу мазков)."""
+                return self.strokes.rasterize(self.full_size)
+
+            def undo(self):
+                if self.strokes is not None and not self._dragging and self.strokes.undo():
+                    self._stroke_done(None)
+
+            def redo(self):
+                if self.strokes is not None and not self._dragging and self.strokes.redo():
+                    self._stroke_done(None)
+
+            def _ensure_layers(self):
+                _, _, w, h = self._label_rect_for_image()
+                if self._layers_size != (w, h):
+                    self._layers_size = (w, h)
+                    small = cv2.resize(self.base_rgb, (w, h), interpolation=cv2.INTER_AREA)
+                    self._base_pix = _np_rgb_to_qpix(small)
+                    self._heat_pix = None
+                    self._mask_rgba = np.zeros((h, w, 4), dtype=np.uint8)
+                    self._mask_img = QtGui.QImage(self._mask_rgba.data, w, h, 4 * w,
+                                                  QtGui.QImage.Format_RGBA8888_Premultiplied)
+                    self._update_mask_layer()
+                if self.show_ai and self.ai_heat is not None and self._heat_pix is None:
+                    self._heat_pix = _np_rgb_to_qpix(_colorize_heatmap(self.ai_heat, w, h))
+
+            def _update_mask_layer(self, rect=None) -> QtCore.QRect | None:
+                """
+                Перерисовывает участок слоя маски (rect — в координатах снимка).
+                Пиксель слоя (dx, dy) берёт значение маски в (dx*W//w, dy*H//h).
+                Возвращает изменённую область в координатах виджета.
+                """
+                if self._mask_rgba is None:
+                    return None
+                w, h = self._layers_size
+                H, W = self.user_mask.shape
+                if rect is None:
+                    dx0, dy0, dx1, dy1 = 0, 0, w, h
+                else:
+                    x0, y0, x1, y1 = rect
+                    dx0, dy0 = x0 * w // W, y0 * h // H
+                    dx1, dy1 = min(w, -(-x1 * w // W)), min(h, -(-y1 * h // H))
+                if dx1 <= dx0 or dy1 <= dy0:
+                    return None
 
-            def _recompose(self, alpha_cam: float):
-                if self.base_rgb is None:
-                    self.view_rgb = None
-                    return
-                out = self.base_rgb.copy()
-                out = _overlay_user_mask(out, (self.user_mask > 0).astype(np.float32), alpha=0.28)
-                if self.show_ai and self.ai_heat is not None:
-                    out = _blend_heatmap_on_rgb(out, self.ai_heat, alpha=alpha_cam)
-                self.view_rgb = out
+                xs = np.arange(dx0, dx1) * W // w
+                ys = np.arange(dy0, dy1) * H // h
+                painted = self.user_mask[ys[:, None], xs[None, :]] > 0
+                region = self._mask_rgba[dy0:dy1, dx0:dx1]
+                region[...] = 0
+                region[painted] = self.MASK_RGBA
+
+                ox, oy, _, _ = self._label_rect_for_image()
+                return QtCore.QRect(ox + dx0, oy + dy0, dx1 - dx0, dy1 - dy0)
+
+            def _stroke_done(self, rect):
+                dirty = self._update_mask_layer(rect)
+                if dirty is None:
+                    self.update()
+                else:
+                    self.update(dirty)
 
             def _label_rect_for_image(self):
                 if self.base_rgb is None:
@@ -1053,12 +1294,6 @@ class MainWindow(QtWidgets.QWidget):
                 iy = max(0, min(H - 1, iy))
                 return ix, iy
 
-            def _paint_at(self, ix: int, iy: int):
-                if self.user_mask is None:
-                    return
-                v = 0 if self.eraser else 1
-                cv2.circle(self.user_mask, (ix, iy), int(self.brush), int(v), thickness=-1)
-
             def mousePressEvent(self, e: QtGui.QMouseEvent):
                 if not self.paint_enabled or self.base_rgb is None:
                     return
@@ -1068,10 +1303,7 @@ class MainWindow(QtWidgets.QWidget):
                 if p is None:
                     return
                 self._dragging = True
-                self._last_pos = p
-                self._paint_at(p[0], p[1])
-                self._recompose(alpha_cam=0.33)
-                self.update()
+                self._stroke_done(self.strokes.begin(p[0], p[1], self._brush_px(), erase=self.eraser))
 
             def mouseMoveEvent(self, e: QtGui.QMouseEvent):
                 if not self.paint_enabled or not self._dragging or self.base_rgb is None:
@@ -1079,34 +1311,30 @@ class MainWindow(QtWidgets.QWidget):
                 p = self._widget_pos_to_image_xy(e.pos())
                 if p is None:
                     return
-                x1, y1 = self._last_pos
-                x2, y2 = p
-                cv2.line(self.user_mask, (x1, y1), (x2, y2), color=(0 if self.eraser else 1), thickness=int(self.brush * 2))
-                self._last_pos = p
-                self._recompose(alpha_cam=0.33)
-                self.update()
+                self._stroke_done(self.strokes.extend(p[0], p[1]))
 
             def mouseReleaseEvent(self, e: QtGui.QMouseEvent):
-                if e.button() == QtCore.Qt.LeftButton:
+                if e.button() == QtCore.Qt.LeftButton and self._dragging:
                     self._dragging = False
-                    self._last_pos = None
+                    self.strokes.end()
 
             def paintEvent(self, event):
                 p = QtGui.QPainter(self)
                 p.setRenderHint(QtGui.QPainter.Antialiasing, True)
                 p.fillRect(self.rect(), QtGui.QColor("#fafafa"))
 
-                if self.view_rgb is None:
+                if self.base_rgb is None:
                     p.setPen(QtGui.QPen(QtGui.QColor("#888"), 1))
                     p.drawText(self.rect(), QtCore.Qt.AlignCenter, "Загрузите изображение")
                     return
 
-                x0, y0, w, h = self._label_rect_for_image()
-                H, W = self.view_rgb.shape[:2]
-                qimg = QtGui.QImage(self.view_rgb.data, W, H, 3 * W, QtGui.QImage.Format_RGB888)
-                pix = QtGui.QPixmap.fromImage(qimg.copy())
-
-                p.drawPixmap(QtCore.QRect(x0, y0, w, h), pix)
+                self._ensure_layers()
+                x0, y0, _, _ = self._label_rect_for_image()
+                p.drawPixmap(x0, y0, self._base_pix)
+                p.drawImage(x0, y0, self._mask_img)
+                if self.show_ai and self._heat_pix is not None:
+                    p.setOpacity(self.alpha_cam)
+                    p.drawPixmap(x0, y0, self._heat_pix)
 
 
         class TrainingPage(QtWidgets.QWidget):
@@ -1121,13 +1349,29 @@ class MainWindow(QtWidgets.QWidget):
                 )
                 self.image_path = None
 
-                self._worker = None
+                self._job_id = None
                 self._dlg = None
                 self.step = 0
 
+                self._service = get_service()
+                self._service.done.connect(self._on_service_done)
+                self._service.fail.connect(self._on_service_fail)
+                self._service.state_changed.connect(self._on_model_state)
+
                 self._build()
                 self._set_step(0)
 
+                self._on_model_state(self._service.state, "")
+                self._service.preload()
+
+            def _undo_paint(self):
+                if self.step == 1:
+                    self.canvas.undo()
+
+            def _redo_paint(self):
+                if self.step == 1:
+                    self.canvas.redo()
+
             def _select_stage(self, stage: int):
                 if stage < 0 or stage > 4:
                     return
@@ -1206,6 +1450,10 @@ class MainWindow(QtWidgets.QWidget):
                 head.setStyleSheet("QLabel{font-size:14px;font-weight:900;border:none;background:transparent;}")
                 rl.addWidget(head)
 
+                self.model_state_lbl = QtWidgets.QLabel("")
+                self.model_state_lbl.setWordWrap(True)
+                rl.addWidget(self.model_state_lbl)
+
                 self.btn_start = QtWidgets.QPushButton("Начать тренировку")
                 self.btn_start.setFixedHeight(46)
                 self.btn_start.clicked.connect(self._start_training)
@@ -1233,6 +1481,22 @@ class MainWindow(QtWidgets.QWidget):
                 tools.addWidget(self.chk_eraser)
 
                 tools.addStretch(1)
+
+                self.btn_undo = QtWidgets.QPushButton("↶")
+                self.btn_undo.setToolTip("Отменить (Ctrl+Z)")
+                self.btn_undo.setFixedSize(36, 30)
+                self.btn_undo.clicked.connect(self.canvas.undo)
+                tools.addWidget(self.btn_undo)
+
+                self.btn_redo = QtWidgets.QPushButton("↷")
+                self.btn_redo.setToolTip("Вернуть (Ctrl+Y)")
+                self.btn_redo.setFixedSize(36, 30)
+                self.btn_redo.clicked.connect(self.canvas.redo)
+                tools.addWidget(self.btn_redo)
+
+                QtWidgets.QShortcut(QtGui.QKeySequence.Undo, self, activated=self._undo_paint)
+                QtWidgets.QShortcut(QtGui.QKeySequence.Redo, self, activated=self._redo_paint)
+
                 cb.addLayout(tools)
 
                 br = QtWidgets.QHBoxLayout()
@@ -1305,6 +1569,25 @@ class MainWindow(QtWidgets.QWidget):
                 self.result_hint.setStyleSheet("QLabel{font-size:11px;color:#3f5d7a;font-weight:700;}")
                 rf.addWidget(self.result_hint)
 
+                heat_row = QtWidgets.QHBoxLayout()
+                heat_row.setSpacing(10)
+
+                self.chk_heat = QtWidgets.QCheckBox("Карта ИИ")
+                self.chk_heat.setChecked(True)
+                self.chk_heat.setStyleSheet("QCheckBox{font-size:12px;font-weight:900;color:#0b2a4a;border:none;background:transparent;}")
+                self.chk_heat.stateChanged.connect(
+                    lambda _: self.canvas.set_show_ai(self.chk_heat.isChecked(), self.heat_slider.value() / 100.0))
+                heat_row.addWidget(self.chk_heat)
+
+                self.heat_slider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+                self.heat_slider.setRange(0, 100)
+                self.heat_slider.setValue(33)
+                self.heat_slider.setToolTip("Непрозрачность карты ИИ")
+                self.heat_slider.valueChanged.connect(lambda v: self.canvas.set_alpha(v / 100.0))
+                heat_row.addWidget(self.heat_slider, 1)
+
+                rf.addLayout(heat_row)
+
                 self.result_frame.setVisible(False)
                 rl.addWidget(self.result_frame)
 
@@ -1331,6 +1614,8 @@ class MainWindow(QtWidgets.QWidget):
                 self.chk_paint.setEnabled(can_edit)
                 self.chk_eraser.setEnabled(can_edit)
                 self.brush_slider.setEnabled(can_edit)
+                self.btn_undo.setEnabled(can_edit)
+                self.btn_redo.setEnabled(can_edit)
 
                 self.btn_confirm_focus.setEnabled(step == 1)
                 self.btn_ai.setEnabled(step == 2)
@@ -1389,14 +1674,15 @@ class MainWindow(QtWidgets.QWidget):
                     RoundedDialog.warning("Нет изображений", "В выбранной папке не найдены изображения (png/jpg/jpeg/bmp).")
                     return
 
-                bgr = _imread_unicode(imgp)
-                if bgr is None:
+                try:
+                    rgb = preprocess.load_display_rgb(imgp)
+                    full_w, full_h = preprocess.image_size(imgp)
+                except (OSError, ValueError):
                     RoundedDialog.warning("Ошибка", "Не удалось открыть изображение.")
                     return
 
-                rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
                 self.image_path = imgp
-                self.canvas.set_image(rgb)
+                self.canvas.set_image(rgb, full_size=(full_w, full_h))
 
                 self.result_frame.setVisible(False)
                 self.ai_out.setText("")
@@ -1406,6 +1692,8 @@ class MainWindow(QtWidgets.QWidget):
                 self.chk_paint.setEnabled(True)
                 self.chk_eraser.setEnabled(True)
                 self.brush_slider.setEnabled(True)
+                self.btn_undo.setEnabled(True)
+                self.btn_redo.setEnabled(True)
 
                 self.chk_paint.setChecked(True)
                 self.chk_eraser.setChecked(False)
@@ -1446,32 +1734,52 @@ class MainWindow(QtWidgets.QWidget):
 
                 self._dlg = LoadingDialog(self, "ИИ анализирует снимок и сравнивает с вашим фокусом…")
                 self._dlg.show()
-                out_png = os.path.join(tempfile.gettempdir(), "retino_heatmap.png")
 
                 self.btn_ai.setEnabled(False)
                 self.stage_combo.setEnabled(False)
                 self.chk_paint.setEnabled(False)
                 self.chk_eraser.setEnabled(False)
                 self.brush_slider.setEnabled(False)
+                self.btn_undo.setEnabled(False)
+                self.btn_redo.setEnabled(False)
 
-                self._worker = InferenceWorker(self.image_path, out_png)
-                self._worker.done.connect(lambda data: self._on_ai_done(data, out_png))
-                self._worker.fail.connect(self._on_ai_fail)
-                self._worker.finished.connect(self._on_ai_finally)
-                self._worker.start()
+                self._job_id = self._service.submit(self.image_path)
 
-            def _on_ai_done(self, data: dict, out_png: str):
+            def _on_model_state(self, state: str, err: str):
+                if state == "ready":
+                    text, color = "Модель ИИ готова к работе", "#16a34a"
+                elif state == "error":
+                    text, color = f"Не удалось загрузить модель ИИ: {err}", "#CC0000"
+                else:
+                    text, color = "Модель ИИ загружается…", "#777"
+                self.model_state_lbl.setText(text)
+                self.model_state_lbl.setStyleSheet(f"QLabel{{font-size:11px;font-weight:800;color:{color};border:none;background:transparent;}}")
+
+            def _on_service_done(self, job_id: int, data: dict):
+                if job_id != self._job_id:
+                    return
+                self._job_id = None
+                self._on_ai_done(data)
+                self._on_ai_finally()
+
+            def _on_service_fail(self, job_id: int, err: str):
+                if job_id != self._job_id:
+                    return
+                self._job_id = None
+                self._on_ai_fail(err)
+                self._on_ai_finally()
+
+            def _on_ai_done(self, data: dict):
                 try:
                     stage_id = int(data.get("stage_id", 0))
                     pmax = float(data.get("p_max", 0.0))
 
-                    heat_u8 = cv2.imdecode(np.fromfile(out_png, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
-                    if heat_u8 is None:
-                        raise RuntimeError("Не удалось прочитать heatmap.png")
-                    heat = heat_u8.astype(np.float32) / 255.0
+                    heat = data.get("heatmap")
+                    if heat is None:
+                        raise RuntimeError("Модель не вернула heatmap")
+                    heat = np.asarray(heat, dtype=np.float32)
 
-                    um = (self.canvas.user_mask > 0).astype(np.uint8)
-                    um_224 = cv2.resize(um, (224, 224), interpolation=cv2.INTER_NEAREST).astype(bool)
+                    um_224 = self.canvas.mask_at((224, 224)).astype(bool)
                     am_224 = _ai_mask_from_heatmap(heat, top_frac=0.30)
 
                     sim = _dice(um_224, am_224)        
@@ -1498,7 +1806,8 @@ class MainWindow(QtWidgets.QWidget):
                     except Exception:
                         pass
 
-                    self.canvas.set_ai_heat(heat, alpha_cam=0.33)
+                    self.chk_heat.setChecked(True)
+                    self.canvas.set_ai_heat(heat, alpha_cam=self.heat_slider.value() / 100.0)
 
                     ai_txt = STAGE_NAMES[ai_stage]
                     user_txt = STAGE_NAMES[user_stage]
@@ -1550,6 +1859,8 @@ class MainWindow(QtWidgets.QWidget):
                 self.chk_paint.setEnabled(False)
                 self.chk_eraser.setEnabled(False)
                 self.brush_slider.setEnabled(False)
+                self.btn_undo.setEnabled(False)
+                self.btn_redo.setEnabled(False)
 
         return TrainingPage(self)
 
@@ -1751,7 +2062,6 @@ class MainWindow(QtWidgets.QWidget):
         delete_btn.clicked.connect(self._delete_account)
         l.addWidget(delete_btn)
 
-        last_v = self._latest_version()
         footer = QtWidgets.QLabel(f"by redictorb, 2026 • MIT License • {current_v}")
         footer.setAlignment(QtCore.Qt.AlignCenter)
         footer.setStyleSheet("font-size: 11px; color: #8a8a8a;")
@@ -1759,16 +2069,6 @@ class MainWindow(QtWidgets.QWidget):
 
         return w
 
-    def _latest_version(self) -> str:
-        try:
-            updates = get_updates() or []
-            if not updates:
-                return "unknown version"
-            latest = max(updates, key=lambda u: int(u.get("id", 0) or 0))
-            return str(latest.get("version", "unknown version"))
-        except Exception:
-            return "unknown version"
-
     def _on_reset_training(self):
         dlg = RoundedDialog(
             self,
@@ -1783,9 +2083,22 @@ class MainWindow(QtWidgets.QWidget):
         if dlg.exec_() != dlg.Accepted:
             return
 
-        ok = reset_training_history()
+        # та же очередь, что и синхронизация: сброс не пересечётся с ней
+        t = task_pool.run("history", self._reset_training_request)
+        t.ok.connect(self._on_reset_training_done)
+        t.fail.connect(lambda _: self._on_reset_training_done(False))
+
+    def _reset_training_request(self) -> bool:
+        # в фоне: и запрос, и очистка локальной базы; в GUI — только перерисовка
+        if not reset_training_history():
+            return False
+        self._history.reset()
+        return True
 
+    def _on_reset_training_done(self, ok: bool):
         if ok:
+            self._apply_stats_data()
+            self._on_outbox_pending(self._outbox.pending())
             done = RoundedDialog(
                 self,
                 "Статистика тренировок успешно сброшена."
@@ -1841,7 +2154,12 @@ class MainWindow(QtWidgets.QWidget):
         if not ok:
             return
 
-        if delete_user_soft("delete my account"):
+        t = task_pool.run("auth", delete_user_soft, "delete my account")
+        t.ok.connect(self._on_delete_account_done)
+        t.fail.connect(lambda _: self._on_delete_account_done(False))
+
+    def _on_delete_account_done(self, ok: bool):
+        if ok:
             RoundedDialog.info("Готово", "Аккаунт удалён.")
             logout()
             self.close()
@@ -1,32 +1,136 @@
 import os
+import time
+import threading
+import warnings
 import numpy as np
-import cv2
 import onnxruntime as ort
-import torch
-import timm
-import torch.nn.functional as F
+import cv2
+
+import preprocess
+import runtime_config
+
+STAGE_NAMES = ["0", "1", "2", "3", "4"]
 
-STAGE_NAMES = ["0", "1", "2", "3", "4"] 
+ORT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "ort")
+
+_GRAPH_OPT = {
+    "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
 
 def _softmax(x: np.ndarray) -> np.ndarray:
-    x = x - np.max(x)
+    x = x - np.max(x, axis=-1, keepdims=True)
     e = np.exp(x)
-    return e / (np.sum(e) + 1e-9)
+    return e / (np.sum(e, axis=-1, keepdims=True) + 1e-9)
+
+
+def _chunks(items: list, n: int):
+    n = max(1, int(n))
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+def _normalize_cams(cam: np.ndarray) -> np.ndarray:
+    lo = cam.min(axis=(1, 2), keepdims=True)
+    hi = cam.max(axis=(1, 2), keepdims=True)
+    return (cam - lo) / (hi - lo + 1e-6)
+
+
+def _result(stage_id: int, probs: np.ndarray, cam: np.ndarray) -> dict:
+    return {
+        "stage_id": int(stage_id),
+        "p_max": float(np.max(probs)),
+        "probs": [float(p) for p in probs],
+        "heatmap": cam.astype(np.float32),
+    }
+
+
+def _session(path: str, cfg: dict) -> ort.InferenceSession:
+    so = ort.SessionOptions()
+    if int(cfg.get("intra_op_threads", 0)) > 0:
+        so.intra_op_num_threads = int(cfg["intra_op_threads"])
+    if int(cfg.get("inter_op_threads", 0)) > 0:
+        so.inter_op_num_threads = int(cfg["inter_op_threads"])
+    so.enable_cpu_mem_arena = bool(cfg.get("cpu_mem_arena", True))
+    level = str(cfg.get("graph_optimization", "all")).lower()
+    so.graph_optimization_level = _GRAPH_OPT.get(level, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+    providers = ["CPUExecutionProvider"]
+
+    if not cfg.get("optimized_model_cache", True) or level == "disable":
+        return ort.InferenceSession(path, so, providers=providers)
+
+    # оптимизированный граф привязан к версии исходного файла и уровню оптимизации
+    st = os.stat(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    opt_path = os.path.join(ORT_CACHE_DIR, f"{stem}.{level}.{st.st_size}_{st.st_mtime_ns}.onnx")
+    if os.path.exists(opt_path):
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        try:
+            return ort.InferenceSession(opt_path, so, providers=providers)
+        except Exception:
+            so.graph_optimization_level = _GRAPH_OPT.get(level, ort.GraphOptimizationLevel.ORT_ENABLE_ALL)
+
+    try:
+        os.makedirs(ORT_CACHE_DIR, exist_ok=True)
+        so.optimized_model_filepath = opt_path
+        so.log_severity_level = 3  # предупреждение о привязке к железу: кэш и так локальный
+        return ort.InferenceSession(path, so, providers=providers)
+    except Exception:
+        so.optimized_model_filepath = ""
+        return ort.InferenceSession(path, so, providers=providers)
 
 
 class LocalRetinaModel:
-    def __init__(self, models_dir: str = "models"):
+    """
+    Стадия считается по models/dr_stage.onnx. Grad-CAM — по
+    models/dr_stage_cam.onnx (см. export_onnx.py), если он есть; тогда
+    torch/timm не импортируются вовсе. Иначе — по best_cls.pt через torch.
+    Вариант (fp32/int8/...) выбирается ключом model_variant в runtime_config.
+    """
+
+    def __init__(self, models_dir: str = "models", config: dict | None = None):
         self.models_dir = models_dir
+        self.config = config if config is not None else runtime_config.load()
 
-        onnx_path = os.path.join(models_dir, "dr_stage.onnx")
+        self.variant = self.config.get("model_variant", "fp32")
+        onnx_path = runtime_config.model_path(models_dir, "dr_stage", self.variant)
+        cam_path = runtime_config.model_path(models_dir, "dr_stage_cam", self.variant)
+        fp32_cam = os.path.join(models_dir, "dr_stage_cam.onnx")
+        if self.variant != "fp32" and os.path.exists(fp32_cam) and cam_path == fp32_cam:
+            # стадию и карту считает CAM-граф; без его квантованной копии
+            # вариант на analyze() не влияет, а стадии predict_stage и
+            # analyze() разошлись бы — работаем на fp32 целиком
+            warnings.warn(f"model_variant={self.variant}: нет квантованного dr_stage_cam, используется fp32")
+            self.variant = "fp32"
+            onnx_path = runtime_config.model_path(models_dir, "dr_stage", self.variant)
         pt_path = os.path.join(models_dir, "best_cls.pt")
 
         if not os.path.exists(onnx_path):
             raise FileNotFoundError(f"Не найден {onnx_path}")
-        if not os.path.exists(pt_path):
+        if not os.path.exists(cam_path) and not os.path.exists(pt_path):
             raise FileNotFoundError(f"Не найден {pt_path}")
 
-        self.ort_sess = ort.InferenceSession(onnx_path, providers=["CPUExecutionProvider"])
+        # сессия только стадии нужна predict_stage(s); analyze() при наличии
+        # CAM-графа её не использует, поэтому создаётся при первом обращении
+        self._onnx_path = onnx_path
+        self._ort_sess = None
+        self._ort_lock = threading.Lock()
+
+        self.cam_sess = None
+        self.torch_model = None
+        if os.path.exists(cam_path):
+            self.cam_sess = _session(cam_path, self.config)
+        else:
+            self._load_torch(pt_path)
+
+    def _load_torch(self, pt_path: str):
+        import torch
+        import timm
+
+        if int(self.config.get("torch_threads", 0)) > 0:
+            torch.set_num_threads(int(self.config["torch_threads"]))
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
         self.torch_model = timm.create_model("tf_efficientnet_b0", pretrained=False, num_classes=5)
         sd = torch.load(pt_path, map_location="cpu")
@@ -52,51 +156,185 @@ class LocalRetinaModel:
         self._hooks_set = True
 
     def _preprocess_np(self, image_path: str, size=224) -> np.ndarray:
-        img = cv2.imread(image_path)
-        if img is None:
-            raise ValueError("Не удалось прочитать изображение")
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
-        img = img.astype(np.float32) / 255.0
-        img = np.transpose(img, (2, 0, 1))[None, ...] 
-        return img
-
-    def _preprocess_torch(self, image_path: str, size=224) -> torch.Tensor:
-        x = self._preprocess_np(image_path, size=size)
-        return torch.from_numpy(x)
+        return preprocess.load_batch([image_path], size)
+
+    def _preprocess_batch(self, image_paths: list, size=224) -> np.ndarray:
+        return preprocess.load_batch(image_paths, size)
+
+    @property
+    def ort_sess(self) -> ort.InferenceSession:
+        with self._ort_lock:
+            if self._ort_sess is None:
+                self._ort_sess = _session(self._onnx_path, self.config)
+                # экспорт мог зафиксировать batch=1, тогда батч прогоняем по одному
+                self._ort_batch = not isinstance(self._ort_sess.get_inputs()[0].shape[0], int)
+            return self._ort_sess
+
+    def _ort_logits(self, x: np.ndarray) -> np.ndarray:
+        sess = self.ort_sess
+        if self._ort_batch or x.shape[0] == 1:
+            return sess.run(None, {"image": x})[0]
+        return np.concatenate([sess.run(None, {"image": x[i:i + 1]})[0] for i in range(x.shape[0])], axis=0)
 
     def predict_stage(self, image_path: str):
         x = self._preprocess_np(image_path, 224)
-        logits = self.ort_sess.run(None, {"image": x})[0][0] 
+        logits = self._ort_logits(x)[0]
         probs = _softmax(logits)
         stage_id = int(np.argmax(probs))
         return stage_id, probs
 
-    def gradcam_heatmap(self, image_path: str, class_idx: int | None = None) -> np.ndarray:
+    def predict_stages(self, image_paths: list, batch_size: int = 16) -> list:
+        out = []
+        for chunk in _chunks(list(image_paths), batch_size):
+            probs = _softmax(self._ort_logits(self._preprocess_batch(chunk, 224)))
+            out.extend((int(np.argmax(p)), p) for p in probs)
+        return out
+
+    def _gradcam(self, x: np.ndarray, class_idx: int | None = None):
+        """
+        Grad-CAM для батча [N,3,H,W]. Возвращает логиты [N,5] и карты [N,224,224].
+        """
+        if self.cam_sess is not None:
+            return self._gradcam_onnx(x, class_idx)
+        return self._gradcam_torch(x, class_idx)
+
+    def _gradcam_onnx(self, x: np.ndarray, class_idx: int | None = None):
+        logits, act, cam_weights = self.cam_sess.run(None, {"image": x})
+        if class_idx is None:
+            idx = np.argmax(logits, axis=1)
+        else:
+            idx = np.full((x.shape[0],), int(class_idx))
+
+        w = cam_weights[np.arange(x.shape[0]), idx]              # [N,K]
+        cam = np.maximum(np.einsum("nk,nkhw->nhw", w, act), 0.0)
+        cam = np.stack([cv2.resize(c, (224, 224), interpolation=cv2.INTER_LINEAR) for c in cam])
+        return logits, _normalize_cams(cam)
+
+    def _gradcam_torch(self, x: np.ndarray, class_idx: int | None = None):
+        # В eval-режиме сэмплы независимы, поэтому один backward от суммы
+        # скоров даёт градиенты каждого изображения по отдельности.
+        import torch
+        import torch.nn.functional as F
+
         self._ensure_hooks()
 
-        x = self._preprocess_torch(image_path, 224).to(self.device)
+        x = torch.from_numpy(x).to(self.device)
         x.requires_grad_(True)
 
         logits = self.torch_model(x)
         if class_idx is None:
-            class_idx = int(torch.argmax(logits, dim=1).item())
+            idx = torch.argmax(logits, dim=1)
+        else:
+            idx = torch.full((x.shape[0],), int(class_idx), dtype=torch.long, device=logits.device)
 
-        score = logits[:, class_idx].sum()
+        score = logits.gather(1, idx[:, None]).sum()
         self.torch_model.zero_grad(set_to_none=True)
         score.backward()
 
-        w = self._grad.mean(dim=(2, 3), keepdim=True)        
-        cam = (w * self._act).sum(dim=1, keepdim=True)      
+        w = self._grad.mean(dim=(2, 3), keepdim=True)
+        cam = (w * self._act).sum(dim=1, keepdim=True)
         cam = F.relu(cam)
         cam = F.interpolate(cam, size=(224, 224), mode="bilinear", align_corners=False)
-        cam = cam[0, 0].detach().cpu().numpy()
-        cam = (cam - cam.min()) / (cam.max() - cam.min() + 1e-6)
-        return cam
+        cam = cam[:, 0].detach().cpu().numpy()
+        return logits.detach().cpu().numpy(), _normalize_cams(cam)
+
+    def gradcam_heatmap(self, image_path: str, class_idx: int | None = None) -> np.ndarray:
+        _, cam = self._gradcam(self._preprocess_np(image_path, 224), class_idx)
+        return cam[0]
+
+    def gradcam_heatmaps(self, image_paths: list, class_idx: int | None = None, batch_size: int = 8) -> list:
+        out = []
+        for chunk in _chunks(list(image_paths), batch_size):
+            _, cams = self._gradcam(self._preprocess_batch(chunk, 224), class_idx)
+            out.extend(cams)
+        return out
+
+    def warmup(self, size: int = 224):
+        x = np.zeros((1, 3, size, size), dtype=np.float32)
+        if self.cam_sess is None:
+            self._ort_logits(x)
+        self._gradcam(x)
+
+    def _input(self, image) -> np.ndarray:
+        if isinstance(image, str):
+            return self._preprocess_np(image, 224)
+        image = np.asarray(image)
+        if image.ndim == 4:
+            return np.ascontiguousarray(image, dtype=np.float32)
+        return preprocess.rgb_to_batch(image, 224)
+
+    def analyze(self, image, class_idx: int | None = None):
+        """
+        Стадия, вероятности и Grad-CAM из одного прохода forward(+backward)
+        одной и той же модели, так что стадия и карта всегда согласованы.
+        image — путь к файлу, RGB uint8 HxWx3 или готовый батч [1,3,224,224].
+        """
+        logits, cams = self._gradcam(self._input(image), class_idx)
+        probs = _softmax(logits[0])
+        return int(np.argmax(probs)), probs, cams[0]
+
+    def infer(self, image) -> dict:
+        stage_id, probs, cam = self.analyze(image)
+        return _result(stage_id, probs, cam)
+
+    def infer_batch(self, image_paths: list, batch_size: int = 8) -> list:
+        out = []
+        for chunk in _chunks(list(image_paths), batch_size):
+            logits, cams = self._gradcam(self._preprocess_batch(chunk, 224))
+            for probs, cam in zip(_softmax(logits), cams):
+                out.append(_result(int(np.argmax(probs)), probs, cam))
+        return out
 
 _model: LocalRetinaModel | None = None
+_model_lock = threading.Lock()
 def get_model() -> LocalRetinaModel:
     global _model
-    if _model is None:
-        _model = LocalRetinaModel(models_dir="models")
-    return _model
\ No newline at end of file
+    with _model_lock:
+        if _model is None:
+            _model = LocalRetinaModel(models_dir="models")
+    return _model
+
+
+def _thread_candidates() -> list:
+    n = os.cpu_count() or 1
+    return sorted({c for c in (1, 2, 4, n // 2, n) if 1 <= c <= n})
+
+
+def autotune(models_dir: str = "models", repeats: int = 5) -> dict:
+    """
+    Замеряет analyze() на нескольких вариантах числа потоков и сохраняет
+    самый быстрый в models/runtime.json. Загруженная модель сбрасывается,
+    чтобы следующий get_model() подхватил новые настройки.
+    """
+    global _model
+    cfg = runtime_config.load()
+    x = np.zeros((1, 3, 224, 224), dtype=np.float32)
+
+    timings = {}
+    for n in _thread_candidates():
+        trial = dict(cfg, intra_op_threads=n, torch_threads=n)
+        m = LocalRetinaModel(models_dir, config=trial)
+        m.warmup()
+        t = time.perf_counter()
+        for _ in range(repeats):
+            m.analyze(x)
+        timings[n] = (time.perf_counter() - t) / repeats
+
+    best = min(timings, key=timings.get)
+    with _model_lock:
+        _model = None
+    return runtime_config.update(intra_op_threads=best, torch_threads=best, tuned=True)
+
+
+_autotune_tried = False
+
+
+def autotune_if_needed(models_dir: str = "models") -> None:
+    # одна попытка за запуск: если результат не удалось сохранить,
+    # повторный замер при каждом входе ничего не даст
+    global _autotune_tried
+    cfg = runtime_config.load()
+    if _autotune_tried or not cfg.get("autotune", True) or cfg.get("tuned", False):
+        return
+    _autotune_tried = True
+    autotune(models_dir)
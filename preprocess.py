@@ -0,0 +1,163 @@
+# preprocess.py
+"""
+Единый конвейер подготовки снимков для UI и модели.
+
+Снимок декодируется один раз: из полного буфера сразу строятся копия для
+экрана (load_display_rgb) и вход модели 224x224 (load_model_rgb), а сам
+полный снимок в общий кэш не попадает — он нужен только на время этого
+прохода. Вход модели собирается за один проход: uint8 HWC 224x224 ->
+float32 NCHW прямо в итоговый массив, без промежуточных float-копий и
+отдельного transpose.
+
+Замер:
+    python preprocess.py --bench [image_path]
+"""
+import os
+import sys
+import time
+import numpy as np
+import cv2
+
+import image_cache
+
+MODEL_SIZE = 224
+DISPLAY_MAX = 1024   # длинная сторона копии для экрана
+_INV_255 = np.float32(1.0 / 255.0)
+
+
+def imread_unicode(path: str):
+    data = np.fromfile(path, dtype=np.uint8)
+    return cv2.imdecode(data, cv2.IMREAD_COLOR)
+
+
+def decode_rgb(path: str) -> np.ndarray:
+    bgr = imread_unicode(path)
+    if bgr is None:
+        raise ValueError("Не удалось прочитать изображение")
+    return cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB, dst=bgr)
+
+
+def load_rgb(path: str) -> np.ndarray:
+    """
+    Полный декодированный RGB (только для чтения) в общем кэше. Страница
+    обучения и модель обходятся без него: load_display_rgb/load_model_rgb.
+    """
+    return image_cache.shared().get_or_create(image_cache.file_key("rgb", path), lambda: decode_rgb(path))
+
+
+def _full_rgb(path: str) -> np.ndarray:
+    """Полный снимок: из кэша, если его туда положил load_rgb, иначе новый декод без кэширования."""
+    rgb = image_cache.shared().get(image_cache.file_key("rgb", path))
+    return rgb if rgb is not None else decode_rgb(path)
+
+
+def _model_rgb(rgb: np.ndarray, size: int) -> np.ndarray:
+    return cv2.resize(rgb, (size, size), interpolation=cv2.INTER_AREA)
+
+
+def load_display_rgb(path: str, max_side: int = DISPLAY_MAX) -> np.ndarray:
+    """
+    Уменьшенная копия для экрана и разметки (длинная сторона <= max_side).
+    Заодно из того же декода кэшируются вход модели и размер оригинала
+    (image_size), так что полный снимок больше не декодируется.
+    """
+    def build():
+        cache = image_cache.shared()
+        rgb = _full_rgb(path)
+        H, W = rgb.shape[:2]
+        cache.put(image_cache.file_key("rgb_size", path), (W, H))
+        small_key = image_cache.file_key("rgb_small", path, MODEL_SIZE)
+        if cache.get(small_key) is None:
+            cache.put(small_key, _model_rgb(rgb, MODEL_SIZE))
+        if max(H, W) <= max_side:
+            return rgb
+        s = max_side / max(H, W)
+        return cv2.resize(rgb, (max(1, round(W * s)), max(1, round(H * s))), interpolation=cv2.INTER_AREA)
+
+    return image_cache.shared().get_or_create(image_cache.file_key("rgb_display", path, max_side), build)
+
+
+def image_size(path: str) -> tuple:
+    """(W, H) оригинала."""
+    def build():
+        H, W = _full_rgb(path).shape[:2]
+        return W, H
+
+    return image_cache.shared().get_or_create(image_cache.file_key("rgb_size", path), build)
+
+
+def load_model_rgb(path: str, size: int = MODEL_SIZE) -> np.ndarray:
+    return image_cache.shared().get_or_create(
+        image_cache.file_key("rgb_small", path, size), lambda: _model_rgb(_full_rgb(path), size)
+    )
+
+
+def to_nchw(images: list, out: np.ndarray | None = None) -> np.ndarray:
+    """
+    uint8 HWC -> нормализованный float32 NCHW. transpose здесь — view,
+    а приведение типа и деление на 255 ufunc делает при записи в out.
+    """
+    h, w = images[0].shape[:2]
+    if out is None:
+        out = np.empty((len(images), 3, h, w), dtype=np.float32)
+    for i, img in enumerate(images):
+        np.multiply(img.transpose(2, 0, 1), _INV_255, out=out[i], casting="unsafe")
+    return out
+
+
+def rgb_to_batch(rgb: np.ndarray, size: int = MODEL_SIZE) -> np.ndarray:
+    if rgb.shape[:2] != (size, size):
+        rgb = cv2.resize(rgb, (size, size), interpolation=cv2.INTER_AREA)
+    return to_nchw([rgb])
+
+
+def load_batch(paths: list, size: int = MODEL_SIZE) -> np.ndarray:
+    return to_nchw([load_model_rgb(p, size) for p in paths])
+
+
+def _legacy_preprocess(path: str, size: int = MODEL_SIZE) -> np.ndarray:
+    img = cv2.cvtColor(imread_unicode(path), cv2.COLOR_BGR2RGB)
+    img = cv2.resize(img, (size, size), interpolation=cv2.INTER_AREA)
+    img = img.astype(np.float32) / 255.0
+    return np.transpose(img, (2, 0, 1))[None, ...]
+
+
+def bench(path: str, n: int = 200) -> None:
+    def timeit(fn) -> float:
+        fn()
+        t = time.perf_counter()
+        for _ in range(n):
+            fn()
+        return (time.perf_counter() - t) / n * 1000.0
+
+    def legacy():
+        # как было: декодирование для экрана + отдельный препроцессинг для модели
+        cv2.cvtColor(imread_unicode(path), cv2.COLOR_BGR2RGB)
+        _legacy_preprocess(path)
+
+    def shared_cold():
+        image_cache.shared().clear()
+        load_display_rgb(path)
+        load_batch([path])
+
+    x = load_batch([path])
+    assert np.allclose(x, _legacy_preprocess(path), atol=1e-6)
+
+    print(f"legacy (decode x2):         {timeit(legacy):8.3f} ms")
+    print(f"shared pipeline, cold:      {timeit(shared_cold):8.3f} ms")
+    print(f"shared pipeline, warm:      {timeit(lambda: load_batch([path])):8.3f} ms")
+    print(f"tensor only, legacy:        {timeit(lambda: np.ascontiguousarray(np.transpose(load_model_rgb(path).astype(np.float32) / 255.0, (2, 0, 1))[None])):8.3f} ms")
+    print(f"tensor only, to_nchw:       {timeit(lambda: to_nchw([load_model_rgb(path)])):8.3f} ms")
+
+
+def main():
+    if len(sys.argv) < 2 or sys.argv[1] != "--bench":
+        print("Usage: python preprocess.py --bench [image_path]", file=sys.stderr)
+        sys.exit(2)
+    base = os.path.dirname(os.path.abspath(__file__))
+    path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(base, "samples", "img1.png")
+    bench(path)
+
+
+if __name__ == "__main__":
+    main()
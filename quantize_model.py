@@ -0,0 +1,207 @@
+# quantize_model.py
+"""
+Сборка квантованных вариантов моделей и отчёт о скорости/точности.
+
+    python quantize_model.py [--variants int8,int8_static,fp16] [--models models] [--samples samples]
+
+  int8        — динамическая INT8-квантизация весов (без калибровки);
+  int8_static — статическая INT8 (QDQ), калибровка по снимкам из samples/;
+  fp16        — веса во float16 (нужен пакет onnxconverter-common).
+
+Квантуются dr_stage.onnx и, если есть, dr_stage_cam.onnx. Выбранный вариант
+включается ключом model_variant в models/runtime.json (см. runtime_config).
+Отчёт сравнивает каждый вариант с fp32 на samples/ на том графе, который
+использует приложение (dr_stage_cam, если он есть, иначе dr_stage):
+задержку, долю совпадения стадий, максимальное отклонение вероятностей,
+а для CAM-графа — максимальное отклонение карт и их корреляцию.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+import preprocess
+import runtime_config
+from heatmap_cache import IMAGE_EXTS
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _sample_paths(samples_dir: str) -> list:
+    paths = []
+    for root, _, fnames in os.walk(samples_dir):
+        for f in sorted(fnames):
+            if f.lower().endswith(IMAGE_EXTS):
+                paths.append(os.path.join(root, f))
+    return paths
+
+
+class _SamplesReader:
+    """CalibrationDataReader для quantize_static: по одному снимку за раз."""
+
+    def __init__(self, paths: list, input_name: str = "image"):
+        self._it = iter(paths)
+        self._input_name = input_name
+
+    def get_next(self):
+        p = next(self._it, None)
+        if p is None:
+            return None
+        return {self._input_name: preprocess.load_batch([p])}
+
+    def rewind(self):
+        pass
+
+
+def _out_path(models_dir: str, name: str, variant: str) -> str:
+    return os.path.join(models_dir, f"{name}{runtime_config.VARIANTS[variant]}.onnx")
+
+
+def build_variant(models_dir: str, name: str, variant: str, calib_paths: list) -> str | None:
+    src = os.path.join(models_dir, f"{name}.onnx")
+    if not os.path.exists(src):
+        return None
+    dst = _out_path(models_dir, name, variant)
+
+    if variant == "int8":
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    elif variant == "int8_static":
+        from onnxruntime.quantization import quantize_static, QuantFormat, QuantType
+        if not calib_paths:
+            raise RuntimeError("Для int8_static нужны снимки для калибровки")
+        quantize_static(
+            src, dst, _SamplesReader(calib_paths),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+    elif variant == "fp16":
+        import onnx
+        from onnxconverter_common import float16
+        model = float16.convert_float_to_float16(onnx.load(src), keep_io_types=True)
+        onnx.save(model, dst)
+    else:
+        raise ValueError(f"Неизвестный вариант: {variant}")
+    return dst
+
+
+def _cams(act: np.ndarray, cam_weights: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """Карты Grad-CAM как в ml_local: 224x224, нормированные в [0, 1]."""
+    w = cam_weights[np.arange(act.shape[0]), idx]
+    cam = np.maximum(np.einsum("nk,nkhw->nhw", w, act), 0.0)
+    cam = np.stack([cv2.resize(c, (224, 224), interpolation=cv2.INTER_LINEAR) for c in cam])
+    cam -= cam.min(axis=(1, 2), keepdims=True)
+    return cam / (cam.max(axis=(1, 2), keepdims=True) + 1e-8)
+
+
+def _run_all(path: str, paths: list, repeats: int = 3, ref_idx: np.ndarray | None = None):
+    """
+    Вероятности, задержка и размер файла; для CAM-графа ещё и карты.
+    Карты строятся для класса ref_idx (стадии fp32), чтобы сравнивать
+    именно карты, а не расхождение стадий.
+    """
+    sess = ort.InferenceSession(path, providers=["CPUExecutionProvider"])
+    xs = [preprocess.load_batch([p]) for p in paths]
+    sess.run(None, {"image": xs[0]})
+
+    outs = []
+    t = time.perf_counter()
+    for _ in range(repeats):
+        outs = [sess.run(None, {"image": x}) for x in xs]
+    latency_ms = (time.perf_counter() - t) / (repeats * len(xs)) * 1000.0
+
+    logits = np.concatenate([o[0] for o in outs])
+    e = np.exp(logits - logits.max(axis=1, keepdims=True))
+    probs = e / e.sum(axis=1, keepdims=True)
+
+    cams = None
+    if len(outs[0]) == 3:
+        idx = probs.argmax(1) if ref_idx is None else ref_idx
+        cams = np.concatenate([_cams(o[1], o[2], idx[i:i + 1]) for i, o in enumerate(outs)])
+    return probs, cams, latency_ms, os.path.getsize(path)
+
+
+def _cam_agreement(cams: np.ndarray, ref: np.ndarray) -> tuple:
+    corr = [np.corrcoef(a.ravel(), b.ravel())[0, 1] for a, b in zip(cams, ref)]
+    return float(np.abs(cams - ref).max()), float(np.nanmean(corr))
+
+
+def report(models_dir: str, samples_dir: str, variants: list) -> list:
+    paths = _sample_paths(samples_dir)
+    if not paths:
+        raise RuntimeError(f"Нет снимков в {samples_dir}")
+
+    # тот же граф, что в ml_local.analyze(): стадия и карта из dr_stage_cam
+    name = "dr_stage_cam" if os.path.exists(os.path.join(models_dir, "dr_stage_cam.onnx")) else "dr_stage"
+    ref_probs, ref_cams, ref_ms, ref_size = _run_all(os.path.join(models_dir, f"{name}.onnx"), paths)
+    ref_idx = ref_probs.argmax(1)
+    rows = [{"variant": "fp32", "model": name, "latency_ms": ref_ms, "size_mb": ref_size / 2**20,
+             "stage_match": 1.0, "max_prob_delta": 0.0,
+             "cam_max_delta": 0.0 if ref_cams is not None else None,
+             "cam_corr": 1.0 if ref_cams is not None else None}]
+
+    for v in variants:
+        path = _out_path(models_dir, name, v)
+        if not os.path.exists(path):
+            print(f"[{v}] нет {os.path.basename(path)} — вариант не влияет на приложение", file=sys.stderr)
+            continue
+        probs, cams, ms, size = _run_all(path, paths, ref_idx=ref_idx)
+        cam_delta, cam_corr = _cam_agreement(cams, ref_cams) if cams is not None else (None, None)
+        rows.append({
+            "variant": v,
+            "model": name,
+            "latency_ms": ms,
+            "size_mb": size / 2**20,
+            "stage_match": float(np.mean(probs.argmax(1) == ref_idx)),
+            "max_prob_delta": float(np.abs(probs - ref_probs).max()),
+            "cam_max_delta": cam_delta,
+            "cam_corr": cam_corr,
+        })
+    return rows
+
+
+def _fmt(value, spec: str) -> str:
+    return "—" if value is None else format(value, spec)
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--variants", default="int8,int8_static")
+    ap.add_argument("--models", default="models")
+    ap.add_argument("--samples", default=os.path.join(BASE_DIR, "samples"))
+    ap.add_argument("--report-only", action="store_true")
+    args = ap.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    calib = _sample_paths(args.samples)
+
+    if not args.report_only:
+        for v in variants:
+            for name in ("dr_stage", "dr_stage_cam"):
+                try:
+                    out = build_variant(args.models, name, v, calib)
+                    if out:
+                        print(f"[{v}] {out}")
+                except ImportError as e:
+                    print(f"[{v}] пропущен: {e}", file=sys.stderr)
+
+    rows = report(args.models, args.samples, variants)
+    print(f"model: {rows[0]['model']}")
+    print(f"{'variant':<12} {'latency, ms':>11} {'size, MB':>9} {'stage match':>12} {'max Δp':>8} "
+          f"{'max ΔCAM':>9} {'CAM corr':>9}")
+    for r in rows:
+        print(f"{r['variant']:<12} {r['latency_ms']:>11.2f} {r['size_mb']:>9.1f} {r['stage_match']:>12.2%} "
+              f"{r['max_prob_delta']:>8.4f} {_fmt(r['cam_max_delta'], '.4f'):>9} {_fmt(r['cam_corr'], '.4f'):>9}")
+
+    with open(os.path.join(args.models, "quantization_report.json"), "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
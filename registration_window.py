@@ -1,7 +1,8 @@
 # registration_window.py
 from PyQt5 import QtWidgets, QtCore
 from api_client import register_user, get_maintenance_status
-from ui_dialogs import DeleteAccountDialog, RoundedDialog
+from ui_dialogs import RoundedDialog
+import task_pool
 
 class RegistrationWindow(QtWidgets.QWidget):
     def __init__(self, on_back):
@@ -106,6 +107,7 @@ class RegistrationWindow(QtWidgets.QWidget):
         register_button.setStyleSheet(self.button_style("#0078D7"))
         register_button.clicked.connect(self.handle_registration)
         layout.addWidget(register_button)
+        self.register_button = register_button
 
         switch_to_login_label = QtWidgets.QLabel('Есть аккаунт? <a href="#">Войдите</a>!')
         switch_to_login_label.setAlignment(QtCore.Qt.AlignCenter)
@@ -156,22 +158,44 @@ class RegistrationWindow(QtWidgets.QWidget):
             RoundedDialog.warning("Ошибка", "Одно из полей данных вашего будущего аккаунта пустует.\nПожалуйста, заполните все поля до конца!")
             return
         
+        if password != password_repeat:
+            RoundedDialog.warning("Ошибка", "Введённые вами пароли не совпадают.\nПожалуйста, исправьте ваши пароли!")
+            return
+
+        # сеть — в фоне, окно не замирает на холодном старте сервера
+        self._set_busy(True)
+        t = task_pool.run("auth", self._register_request, username, password)
+        t.ok.connect(self._on_register_result)
+        t.fail.connect(lambda err: self._on_register_result(("error", err)))
+
+    def _set_busy(self, busy: bool):
+        self.register_button.setEnabled(not busy)
+        self.register_button.setText("Регистрация…" if busy else "Зарегистрироваться")
+
+    @staticmethod
+    def _register_request(username: str, password: str):
         try:
             st = get_maintenance_status()
             if st.get("enabled"):
-                msg = st.get("message") or "Ведутся технические работы. Регистрация временно недоступна."
-                RoundedDialog.warning("Технические работы", "Сообщение от сервера: " + msg + "\n\nСейчас в приложении ведутся технические работы. В этот момент просмотр контента приложения, его использование или любые другие действия в нём недоступны. Приносим свои извенения, за доставленные неудобства!")
-                return
+                return "maintenance", st.get("message") or "Ведутся технические работы. Регистрация временно недоступна."
         except Exception:
             pass
-
-        if password != password_repeat:
-            RoundedDialog.warning("Ошибка", "Введённые вами пароли не совпадают.\nПожалуйста, исправьте ваши пароли!")
-            return
-
-        if register_user(username, password):
+        return ("ok", None) if register_user(username, password) else ("taken", None)
+
+    def _on_register_result(self, res):
+        self._set_busy(False)
+        status, msg = res
+        if status == "maintenance":
+            RoundedDialog.warning("Технические работы", "Сообщение от сервера: " + msg + "\n\nСейчас в приложении ведутся технические работы. В этот момент просмотр контента приложения, его использование или любые другие действия в нём недоступны. Приносим свои извенения, за доставленные неудобства!")
+        elif status == "ok":
             RoundedDialog.info("Успех", "Вы успешно зарегистрировались!")
             self.handle_back()
+        elif status == "error":
+            # сеть или ошибка сервера — логин при этом может быть свободен
+            RoundedDialog.warning(
+                "Ошибка соединения",
+                "Не удалось связаться с сервером.\nПроверьте подключение к интернету и попробуйте ещё раз."
+            )
         else:
             RoundedDialog.warning(
                 "Логин занят",
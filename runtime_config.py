@@ -0,0 +1,101 @@
+# runtime_config.py
+"""
+Локальные настройки инференса: models/runtime.json.
+Любой ключ можно переопределить переменной окружения RETINO_<KEY>
+(например RETINO_INTRA_OP_THREADS=4).
+"""
+import os
+import json
+import threading
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.join(BASE_DIR, "models", "runtime.json")
+
+# fp32 | int8 | int8_static | fp16 — см. quantize_model.py
+VARIANTS = {
+    "fp32": "",
+    "int8": ".int8",
+    "int8_static": ".int8s",
+    "fp16": ".fp16",
+}
+
+DEFAULTS = {
+    "model_variant": "fp32",
+    # onnxruntime: 0 — значение по умолчанию самого ORT
+    "intra_op_threads": 0,
+    "inter_op_threads": 0,
+    "graph_optimization": "all",        # disable | basic | extended | all
+    "optimized_model_cache": True,      # хранить оптимизированный граф в cache/ort
+    "cpu_mem_arena": True,
+    # torch.set_num_threads, 0 — не трогать
+    "torch_threads": 0,
+    # подбор числа потоков при первом запуске
+    "autotune": True,
+    "tuned": False,
+}
+
+_lock = threading.Lock()
+
+
+def _coerce(default, raw: str):
+    if isinstance(default, bool):
+        return raw.strip().lower() in ("1", "true", "yes", "on")
+    if isinstance(default, int):
+        return int(raw)
+    if isinstance(default, float):
+        return float(raw)
+    return raw
+
+
+def load() -> dict:
+    cfg = dict(DEFAULTS)
+    try:
+        with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            cfg.update(data)
+    except (OSError, ValueError):
+        pass
+
+    for key, default in DEFAULTS.items():
+        env = os.environ.get("RETINO_" + key.upper())
+        if env is None:
+            continue
+        try:
+            cfg[key] = _coerce(default, env)
+        except ValueError:
+            pass
+    return cfg
+
+
+def update(**values) -> dict:
+    with _lock:
+        try:
+            with open(CONFIG_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {}
+        except (OSError, ValueError):
+            data = {}
+        data.update(values)
+        os.makedirs(os.path.dirname(CONFIG_PATH), exist_ok=True)
+        tmp = CONFIG_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, CONFIG_PATH)
+    return load()
+
+
+def model_path(models_dir: str, name: str, variant: str | None = None) -> str:
+    """
+    Путь к файлу нужного варианта модели (dr_stage.int8.onnx и т.п.).
+    Если вариант не собран — возвращается исходный fp32.
+    """
+    if variant is None:
+        variant = load().get("model_variant", "fp32")
+    suffix = VARIANTS.get(variant, "")
+    if suffix:
+        path = os.path.join(models_dir, f"{name}{suffix}.onnx")
+        if os.path.exists(path):
+            return path
+    return os.path.join(models_dir, f"{name}.onnx")
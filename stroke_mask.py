@@ -0,0 +1,142 @@
+# stroke_mask.py
+"""
+Разметка пользователя как журнал мазков, а не только как растр.
+
+Мазок — {"erase": bool, "r": радиус, "pts": [[x, y], ...]} в координатах
+опорного размера (width x height). Текущий растр ведётся инкрементально:
+каждый сегмент дорисовывается в mask сразу. Отмена/возврат двигают
+указатель по журналу; растр восстанавливается с ближайшего снимка
+(каждые SNAPSHOT_EVERY мазков, хранится упакованным по биту на пиксель)
+и доигрыванием оставшихся мазков. Журнал сериализуется в JSON и
+растеризуется в любом разрешении (rasterize).
+"""
+import json
+
+import cv2
+import numpy as np
+
+SNAPSHOT_EVERY = 16
+
+
+def _draw(mask: np.ndarray, stroke: dict, scale_x: float = 1.0, scale_y: float = 1.0, start: int = 0):
+    """Рисует мазок (с точки start) в mask. Возвращает (x0, y0, x1, y1) или None."""
+    pts = stroke["pts"]
+    if not pts:
+        return None
+    value = 0 if stroke["erase"] else 1
+    r = max(1, int(round(stroke["r"] * (scale_x + scale_y) / 2)))
+    xy = [(int(round(x * scale_x)), int(round(y * scale_y))) for x, y in pts[max(0, start - 1):]]
+    if start == 0:
+        cv2.circle(mask, xy[0], r, value, thickness=-1)
+    for a, b in zip(xy, xy[1:]):
+        cv2.line(mask, a, b, color=value, thickness=r * 2)
+
+    H, W = mask.shape[:2]
+    pad = r + 2
+    xs = [p[0] for p in xy]
+    ys = [p[1] for p in xy]
+    return (max(0, min(xs) - pad), max(0, min(ys) - pad),
+            min(W, max(xs) + pad + 1), min(H, max(ys) + pad + 1))
+
+
+class StrokeMask:
+    def __init__(self, width: int, height: int):
+        self.width = int(width)
+        self.height = int(height)
+        self.mask = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.strokes: list = []
+        self._pos = 0                 # сколько мазков журнала применено
+        self._snapshots = {0: None}   # позиция -> packbits растра (None — пустой)
+        self._current = None
+
+    # --- рисование ---
+
+    def begin(self, x: int, y: int, radius: int, erase: bool = False):
+        self._current = {"erase": bool(erase), "r": int(radius), "pts": [[int(x), int(y)]]}
+        return _draw(self.mask, self._current)
+
+    def extend(self, x: int, y: int):
+        if self._current is None:
+            return None
+        pts = self._current["pts"]
+        pts.append([int(x), int(y)])
+        return _draw(self.mask, self._current, start=len(pts) - 1)
+
+    def end(self):
+        if self._current is None:
+            return
+        stroke, self._current = self._current, None
+        # новый мазок после отмены отбрасывает ветку «вернуть»
+        del self.strokes[self._pos:]
+        for k in [k for k in self._snapshots if k > self._pos]:
+            del self._snapshots[k]
+        self.strokes.append(stroke)
+        self._pos += 1
+        if self._pos % SNAPSHOT_EVERY == 0:
+            self._snapshots[self._pos] = np.packbits(self.mask)
+
+    # --- отмена ---
+
+    def can_undo(self) -> bool:
+        return self._pos > 0
+
+    def can_redo(self) -> bool:
+        return self._pos < len(self.strokes)
+
+    def undo(self) -> bool:
+        if not self.can_undo():
+            return False
+        self._seek(self._pos - 1)
+        return True
+
+    def redo(self) -> bool:
+        if not self.can_redo():
+            return False
+        _draw(self.mask, self.strokes[self._pos])
+        self._pos += 1
+        return True
+
+    def _seek(self, pos: int):
+        base = max(k for k in self._snapshots if k <= pos)
+        packed = self._snapshots[base]
+        if packed is None:
+            self.mask[...] = 0
+        else:
+            self.mask[...] = np.unpackbits(packed, count=self.mask.size).reshape(self.mask.shape)
+        for stroke in self.strokes[base:pos]:
+            _draw(self.mask, stroke)
+        self._pos = pos
+
+    def clear(self):
+        self.mask[...] = 0
+        self.strokes = []
+        self._pos = 0
+        self._snapshots = {0: None}
+        self._current = None
+
+    # --- растр в другом разрешении и сериализация ---
+
+    def rasterize(self, size) -> np.ndarray:
+        """Маска (uint8 0/1) размера size=(w, h), заново по журналу."""
+        w, h = int(size[0]), int(size[1])
+        out = np.zeros((h, w), dtype=np.uint8)
+        sx, sy = w / self.width, h / self.height
+        for stroke in self.strokes[:self._pos]:
+            _draw(out, stroke, sx, sy)
+        return out
+
+    def to_json(self) -> str:
+        return json.dumps({"size": [self.width, self.height], "strokes": self.strokes[:self._pos]},
+                          separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, text: str) -> "StrokeMask":
+        data = json.loads(text)
+        sm = cls(*data["size"])
+        for stroke in data.get("strokes", []):
+            _draw(sm.mask, stroke)
+            sm.strokes.append(stroke)
+            sm._pos += 1
+            if sm._pos % SNAPSHOT_EVERY == 0:
+                sm._snapshots[sm._pos] = np.packbits(sm.mask)
+        return sm
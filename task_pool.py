@@ -0,0 +1,142 @@
+# task_pool.py
+"""
+Общий пул фоновых задач вместо отдельного QThread на каждый вызов API.
+
+Потоки создаются один раз (ThreadPoolExecutor), а у каждого вида задач
+свой лимит одновременных запусков: лишние ждут в очереди вида и не
+занимают поток. Результат приходит в Qt сигналами:
+
+    t = task_pool.run("history", self._sync_history)
+    t.ok.connect(self._on_history)
+    t.fail.connect(self._on_error)
+    ...
+    t.cancel()   # из очереди — снимается; уже запущенная — сигналов не будет
+"""
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from PyQt5 import QtCore
+
+MAX_WORKERS = 8
+
+# сколько задач одного вида выполняется одновременно
+LIMITS = {
+    "default": 4,
+    "auth": 1,
+    "maintenance": 1,
+    "history": 1,
+}
+
+
+class TaskPool:
+    def __init__(self, max_workers: int = MAX_WORKERS, limits: dict | None = None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task")
+        self.limits = dict(LIMITS, **(limits or {}))
+        self._running = defaultdict(int)
+        self._queued = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _limit(self, kind: str) -> int:
+        return self.limits.get(kind, self.limits["default"])
+
+    def submit(self, kind: str, fn, *args, **kwargs) -> Future:
+        future = Future()
+        with self._lock:
+            self._queued[kind].append((future, fn, args, kwargs))
+            self._pump(kind)
+        return future
+
+    def _pump(self, kind: str):
+        # вызывается под self._lock
+        q = self._queued[kind]
+        while q and self._running[kind] < self._limit(kind):
+            future, fn, args, kwargs = q.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._running[kind] += 1
+            self.executor.submit(self._run, kind, future, fn, args, kwargs)
+
+    def _run(self, kind: str, future: Future, fn, args, kwargs):
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._running[kind] -= 1
+                self._pump(kind)
+
+    def busy(self, kind: str) -> int:
+        with self._lock:
+            return self._running[kind] + len(self._queued[kind])
+
+    def shutdown(self):
+        with self._lock:
+            for q in self._queued.values():
+                for future, *_ in q:
+                    future.cancel()
+                q.clear()
+        self.executor.shutdown(wait=False)
+
+
+_pool: TaskPool | None = None
+_pool_lock = threading.Lock()
+
+
+def shared() -> TaskPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = TaskPool()
+            app = QtCore.QCoreApplication.instance()
+            if app is not None:
+                app.aboutToQuit.connect(_pool.shutdown)
+    return _pool
+
+
+_pending: set = set()
+
+
+class Task(QtCore.QObject):
+    """Доставка результата concurrent.futures.Future в поток GUI сигналами."""
+    ok = QtCore.pyqtSignal(object)
+    fail = QtCore.pyqtSignal(str)
+
+    def __init__(self, future: Future):
+        super().__init__()
+        _pending.add(self)
+        self.future = future
+        self._cancelled = False
+        # подписка — после возврата в цикл Qt, чтобы вызывающий успел подключить слоты
+        QtCore.QTimer.singleShot(0, self._arm)
+
+    def _arm(self):
+        self.ok.connect(self._release)
+        self.fail.connect(self._release)
+        self.future.add_done_callback(self._done)
+
+    def _done(self, future: Future):
+        # может вызываться в рабочем потоке; сигналы доставляются в поток GUI очередью
+        if self._cancelled or future.cancelled():
+            return
+        exc = future.exception()
+        if exc is not None:
+            self.fail.emit(str(exc))
+        else:
+            self.ok.emit(future.result())
+
+    def _release(self, *_):
+        QtCore.QTimer.singleShot(0, lambda: _pending.discard(self))
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def cancel(self):
+        self._cancelled = True
+        self.future.cancel()
+        _pending.discard(self)
+
+
+def run(kind: str, fn, *args, **kwargs) -> Task:
+    return Task(shared().submit(kind, fn, *args, **kwargs))
@@ -0,0 +1,255 @@
+import threading
+import time
+
+import pytest
+
+import api_client
+from api_client import _bulk_results
+
+
+class FakeResponse:
+    def __init__(self, status_code: int, data=None, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise api_client.requests.HTTPError(f"HTTP {self.status_code}")
+
+    def json(self):
+        if self._data is None:
+            raise ValueError("no json")
+        return self._data
+
+
+class FakeSession:
+    """
+    Ответы по маршруту: список ответов (по очереди) или функция — от тела
+    запроса для POST и от заголовков для GET.
+    """
+
+    def __init__(self, routes: dict):
+        self.routes = routes
+        self.posts = []
+        self.gets = []
+
+    def get(self, url, headers=None, timeout=None):
+        path = url[len(api_client.BASE_URL):]
+        self.gets.append((path, headers))
+        route = self.routes[path]
+        resp = route(headers) if callable(route) else route.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        path = url[len(api_client.BASE_URL):]
+        self.posts.append((path, json, headers))
+        route = self.routes[path]
+        resp = route(json) if callable(route) else route.pop(0)
+        if isinstance(resp, Exception):
+            raise resp
+        return resp
+
+
+@pytest.fixture
+def session(monkeypatch):
+    def install(routes: dict) -> FakeSession:
+        s = FakeSession(routes)
+        monkeypatch.setattr(api_client, "_get_session", lambda: s)
+        return s
+
+    monkeypatch.setattr(api_client, "_bulk_supported", None)
+    monkeypatch.setattr(api_client, "_cache", {})
+    monkeypatch.setattr(api_client, "_inflight", {})
+    return install
+
+
+def _recs(n: int) -> list:
+    return [{"user_stage": 1, "ai_stage": 1, "score": 5, "ts": f"t{i}", "idempotency_key": f"k{i}"} for i in range(n)]
+
+
+def test_bulk_results_formats():
+    assert _bulk_results(None, 2) == [None, None]
+    assert _bulk_results({}, 2) == [None, None]
+    assert _bulk_results({"results": [True, False]}, 2) == [None, "rejected"]
+    assert _bulk_results({"results": [{"ok": True}, {"ok": False, "error": "bad ts"}]}, 2) == [None, "bad ts"]
+    assert _bulk_results({"failed": [1, {"index": 2, "error": "dup"}, 7]}, 3) == [None, "rejected", "dup"]
+    # длина results не совпала — такой список не разбирается
+    assert _bulk_results({"results": [False]}, 2) == [None, None]
+
+
+def test_bulk_upload_in_chunks(session, monkeypatch):
+    monkeypatch.setattr(api_client, "BULK_CHUNK", 2)
+    s = session({"/training/records": lambda body: FakeResponse(200, {"failed": [0]})})
+
+    assert api_client.save_training_records(_recs(3)) == ["rejected", None, "rejected"]
+    assert [len(body["records"]) for _, body, _ in s.posts] == [2, 1]
+    assert s.posts[0][1]["records"][1]["idempotency_key"] == "k1"
+    assert api_client._bulk_supported is True
+
+
+def test_falls_back_to_single_records_without_bulk_route(session):
+    s = session({
+        "/training/records": [FakeResponse(404)],
+        "/training/record": lambda body: FakeResponse(200 if body["ts"] != "t1" else 422),
+    })
+    assert api_client.save_training_records(_recs(3)) == [None, "rejected", None]
+    assert api_client._bulk_supported is False
+    assert s.posts[1][2]["Idempotency-Key"] == "k0"
+
+    # пакетный маршрут больше не пробуется
+    api_client.save_training_records(_recs(1))
+    assert [p for p, _, _ in s.posts].count("/training/records") == 1
+
+
+def test_rejected_batch_is_retried_one_by_one(session):
+    session({
+        "/training/records": [FakeResponse(400)],
+        "/training/record": lambda body: FakeResponse(200),
+    })
+    assert api_client.save_training_records(_recs(2)) == [None, None]
+    assert api_client._bulk_supported is None
+
+
+def test_server_error_marks_chunk(session):
+    session({"/training/records": [FakeResponse(503)]})
+    assert api_client.save_training_records(_recs(2)) == ["HTTP 503", "HTTP 503"]
+
+
+def test_network_error_keeps_partial_results(session, monkeypatch):
+    monkeypatch.setattr(api_client, "BULK_CHUNK", 2)
+    session({"/training/records": [FakeResponse(200, {}), api_client.requests.ConnectionError("down")]})
+    assert api_client.save_training_records(_recs(4)) == [None, None, "network", "network"]
+
+
+def test_network_error_in_single_record_fallback(session):
+    calls = []
+
+    def single(body):
+        calls.append(body["ts"])
+        return FakeResponse(200) if len(calls) < 2 else api_client.requests.Timeout("slow")
+
+    session({"/training/records": [FakeResponse(404)], "/training/record": single})
+    assert api_client.save_training_records(_recs(3)) == [None, "network", "network"]
+    assert calls == ["t0", "t1"]
+
+
+# --- кэш GET публичных эндпоинтов ---
+
+def _expire(key: str):
+    api_client._cache[key]["expires"] = 0.0
+
+
+def _start_while_inflight(s: FakeSession, threads: list, release: threading.Event):
+    """Первый поток отправляет запрос, остальные стартуют, пока он не завершён."""
+    threads[0].start()
+    while not s.gets:
+        pass
+    for t in threads[1:]:
+        t.start()
+    time.sleep(0.1)
+    release.set()
+
+
+def test_fresh_entry_makes_no_request(session):
+    s = session({"/public/updates": [FakeResponse(200, [{"version": "1.0"}])]})
+    assert api_client.get_updates() == [{"version": "1.0"}]
+    assert api_client.get_updates() == [{"version": "1.0"}]
+    assert len(s.gets) == 1
+
+
+def test_stale_entry_revalidates_and_304_extends_ttl(session):
+    s = session({"/public/updates": [
+        FakeResponse(200, [{"version": "1.0"}], headers={"ETag": '"v1"', "Last-Modified": "Mon, 01 Jan 2024"}),
+        FakeResponse(304),
+    ]})
+    api_client.get_updates()
+    _expire("updates")
+
+    assert api_client.get_updates() == [{"version": "1.0"}]
+    assert s.gets[1][1]["If-None-Match"] == '"v1"'
+    assert s.gets[1][1]["If-Modified-Since"] == "Mon, 01 Jan 2024"
+    assert api_client._cache["updates"]["expires"] > 0.0
+
+    api_client.get_updates()
+    assert len(s.gets) == 2
+
+
+def test_concurrent_callers_share_one_request(session):
+    release = threading.Event()
+
+    def slow(headers):
+        release.wait(5)
+        return FakeResponse(200, {"enabled": False})
+
+    s = session({"/status/maintenance": slow})
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(api_client.get_maintenance_status()))
+               for _ in range(5)]
+    _start_while_inflight(s, threads, release)
+    for t in threads:
+        t.join(5)
+
+    assert results == [{"enabled": False}] * 5
+    assert len(s.gets) == 1
+
+
+def test_error_reaches_every_waiter_and_clears_inflight(session):
+    release = threading.Event()
+
+    def failing(headers):
+        release.wait(5)
+        raise api_client.requests.ConnectionError("down")
+
+    s = session({"/status/maintenance": failing})
+    errors = []
+
+    def call():
+        try:
+            api_client.get_maintenance_status()
+        except api_client.requests.ConnectionError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(3)]
+    _start_while_inflight(s, threads, release)
+    for t in threads:
+        t.join(5)
+
+    assert len(errors) == 3
+    assert len(s.gets) == 1
+    assert api_client._inflight == {}
+
+
+def test_revalidation_error_is_raised_and_entry_kept(session):
+    s = session({"/public/updates": [
+        FakeResponse(200, [{"version": "1.0"}], headers={"ETag": '"v1"'}),
+        api_client.requests.Timeout("slow"),
+        FakeResponse(304),
+    ]})
+    api_client.get_updates()
+    _expire("updates")
+
+    with pytest.raises(api_client.requests.Timeout):
+        api_client.get_updates()
+    # устаревшая запись не отдаётся, но остаётся для следующей ревалидации
+    assert api_client.get_updates() == [{"version": "1.0"}]
+    assert s.gets[2][1]["If-None-Match"] == '"v1"'
+
+
+def test_invalidate_cache_forces_refetch(session):
+    s = session({"/public/updates": [FakeResponse(200, [1]), FakeResponse(200, [2])]})
+    assert api_client.get_updates() == [1]
+    api_client.invalidate_cache("updates")
+    assert api_client.get_updates() == [2]
+    assert s.gets[1][1].get("If-None-Match") is None
+
+
+def test_single_record_fallback_separates_server_errors(session):
+    codes = {"t0": 200, "t1": 422, "t2": 503}
+    session({
+        "/training/records": [FakeResponse(404)],
+        "/training/record": lambda body: FakeResponse(codes[body["ts"]]),
+    })
+    assert api_client.save_training_records(_recs(3)) == [None, "rejected", "HTTP 503"]
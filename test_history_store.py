@@ -0,0 +1,70 @@
+from history_store import HistoryStore, _canon_ts
+
+
+def _local(ts="2024-05-01T10:00:00"):
+    return {"ts": ts, "user_stage": 2, "ai_stage": 2, "score": 5, "dice": 0.5, "p_max": 0.9}
+
+
+def test_canon_ts_variants():
+    assert _canon_ts("2024-05-01T10:00:00") == "2024-05-01T10:00:00"
+    assert _canon_ts("2024-05-01 10:00:00.123456") == "2024-05-01T10:00:00"
+    assert _canon_ts("not a date") == "not a date"
+
+
+def test_server_copy_with_reformatted_ts_merges(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    store.add(_local(), outbox_key="k1")
+    store.outbox_done(["k1"])
+
+    store.replace_synced([dict(_local("2024-05-01 10:00:00.000"), id=7)])
+    assert store.summary()["total"] == 1
+    assert [r["id"] for r in store.records()] == [7]
+
+
+def test_server_copy_matched_by_idempotency_key(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    store.add(_local(), outbox_key="k1")
+    store.outbox_done(["k1"])
+
+    # сервер сдвинул время, но вернул ключ
+    store.merge([dict(_local("2024-05-01T07:00:00"), id=7, idempotency_key="k1")])
+    assert store.summary()["total"] == 1
+
+
+def test_full_sync_drops_sent_local_rows_without_pair(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    store.add(_local(), outbox_key="sent")
+    store.outbox_done(["sent"])
+    store.add(_local("2024-05-01T11:00:00"), outbox_key="pending")
+
+    store.replace_synced([dict(_local("2024-05-01T07:00:00"), id=7)])
+    assert [r["ts"] for r in store.records()] == ["2024-05-01T07:00:00", "2024-05-01T11:00:00"]
+    assert store.outbox_count() == 1
+
+
+def test_clear_drops_pending_outbox(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    other = HistoryStore(str(tmp_path / "h.sqlite3"), "bob")
+    store.add(_local(), outbox_key="a1")
+    other.add(_local(), outbox_key="b1")
+
+    store.clear()
+    assert store.summary()["total"] == 0
+    assert store.outbox_count() == 0
+    assert other.outbox_count() == 1
+
+
+def test_parked_outbox_entry_is_not_due_but_row_stays(tmp_path):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    store.add(_local(), outbox_key="bad")
+    store.add(_local("2024-05-01T11:00:00"), outbox_key="good")
+
+    store.outbox_park("bad", "invalid stage")
+    assert [k for k, _, _ in store.outbox_due()] == ["good"]
+    assert store.outbox_count() == 1
+    assert store.summary()["total"] == 2
+
+    # полная синхронизация не удаляет запись, которую сервер не принял
+    store.outbox_done(["good"])
+    store.replace_synced([])
+    assert [r["ts"] for r in store.records()] == ["2024-05-01T10:00:00"]
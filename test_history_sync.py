@@ -0,0 +1,106 @@
+import threading
+
+import history_sync
+from history_store import HistoryStore
+from history_sync import HistorySync
+
+
+def _rec(i: int) -> dict:
+    return {"id": i, "ts": f"2024-01-01T00:00:{i:02d}", "user_stage": 1, "ai_stage": 1, "score": 5}
+
+
+class FakeServer:
+    def __init__(self, records, supports_since=True):
+        self.records = list(records)
+        self.supports_since = supports_since
+        self.calls = []
+
+    def __call__(self, limit=2000, since_id=None, since_ts=None):
+        self.calls.append((since_id, since_ts))
+        if self.supports_since and since_id is not None:
+            return [r for r in self.records if r["id"] > since_id]
+        return list(self.records)
+
+
+def test_first_sync_is_full_then_uses_cursor(monkeypatch):
+    server = FakeServer([_rec(1), _rec(2)])
+    monkeypatch.setattr(history_sync, "get_training_history", server)
+    hs = HistorySync()
+
+    assert hs.sync()
+    assert server.calls[-1] == (None, None)
+
+    assert not hs.sync()
+    assert server.calls[-1] == (2, "2024-01-01T00:00:02")
+
+    server.records.append(_rec(3))
+    assert hs.sync()
+    assert hs.supports_since is True
+    assert [r["id"] for r in hs.records] == [1, 2, 3]
+
+
+def test_falls_back_to_full_replace_when_cursor_ignored(monkeypatch):
+    server = FakeServer([_rec(1), _rec(2)], supports_since=False)
+    monkeypatch.setattr(history_sync, "get_training_history", server)
+    hs = HistorySync()
+    hs.sync()
+
+    server.records.append(_rec(3))
+    assert hs.sync()
+    assert hs.supports_since is False
+    assert [r["id"] for r in hs.records] == [1, 2, 3]
+
+    # дальше курсор не отправляется
+    server.records = [_rec(3)]
+    assert hs.sync()
+    assert server.calls[-1] == (None, None)
+    assert [r["id"] for r in hs.records] == [3]
+
+
+def test_cursor_survives_restart_via_store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    server = FakeServer([_rec(1), _rec(2)])
+    monkeypatch.setattr(history_sync, "get_training_history", server)
+    HistorySync(store=store).sync()
+
+    hs = HistorySync(store=store)
+    server.records.append(_rec(3))
+    assert hs.sync()
+    assert server.calls[-1][0] == 2
+    assert store.summary()["total"] == 3
+
+
+def test_reset_clears_store(tmp_path, monkeypatch):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    monkeypatch.setattr(history_sync, "get_training_history", FakeServer([_rec(1)]))
+    hs = HistorySync(store=store)
+    hs.sync()
+
+    hs.reset()
+    assert hs.records == []
+    assert store.summary()["total"] == 0
+
+
+def test_reset_does_not_wait_for_sync_and_drops_its_result(monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(limit=2000, since_id=None, since_ts=None):
+        started.set()
+        release.wait(5)
+        return [_rec(1)]
+
+    monkeypatch.setattr(history_sync, "get_training_history", slow)
+    hs = HistorySync()
+    result = []
+    t = threading.Thread(target=lambda: result.append(hs.sync()))
+    t.start()
+    assert started.wait(5)
+
+    done = threading.Event()
+    threading.Thread(target=lambda: (hs.reset(), done.set())).start()
+    assert done.wait(1)          # reset не ждёт сетевой запрос
+
+    release.set()
+    t.join(5)
+    assert result == [False]
+    assert hs.records == []
@@ -0,0 +1,57 @@
+import numpy as np
+
+from image_cache import ByteLRUCache
+
+
+def _arr(nbytes: int) -> np.ndarray:
+    return np.zeros(nbytes, dtype=np.uint8)
+
+
+def test_evicts_least_recently_used_by_bytes():
+    cache = ByteLRUCache(max_bytes=300)
+    cache.put("a", _arr(100))
+    cache.put("b", _arr(100))
+    cache.put("c", _arr(100))
+    assert cache.get("a") is not None   # "a" становится самым свежим
+
+    cache.put("d", _arr(100))
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+    assert cache.stats()["bytes"] == 300
+
+
+def test_replacing_key_updates_size():
+    cache = ByteLRUCache(max_bytes=300)
+    cache.put("a", _arr(200))
+    cache.put("a", _arr(50))
+    assert cache.stats() == {"entries": 1, "bytes": 50, "max_bytes": 300, "hits": 0, "misses": 0}
+
+
+def test_oversized_value_is_not_cached():
+    cache = ByteLRUCache(max_bytes=100)
+    cache.put("small", _arr(60))
+    value = cache.put("big", _arr(101))
+    assert value.nbytes == 101
+    assert cache.get("big") is None
+    assert cache.get("small") is not None
+
+
+def test_cached_arrays_are_read_only():
+    cache = ByteLRUCache(max_bytes=100)
+    a = cache.put("a", _arr(10))
+    assert not a.flags.writeable
+
+
+def test_get_or_create_calls_factory_once():
+    cache = ByteLRUCache(max_bytes=100)
+    calls = []
+
+    def factory():
+        calls.append(1)
+        return _arr(10)
+
+    cache.get_or_create("a", factory)
+    cache.get_or_create("a", factory)
+    assert len(calls) == 1
+    assert cache.stats()["hits"] == 1
@@ -0,0 +1,94 @@
+import numpy as np
+
+import stroke_mask
+from stroke_mask import StrokeMask
+
+
+def _stroke(sm: StrokeMask, pts, radius=3, erase=False):
+    sm.begin(*pts[0], radius, erase)
+    for x, y in pts[1:]:
+        sm.extend(x, y)
+    sm.end()
+
+
+def test_undo_redo_restore_exact_raster():
+    sm = StrokeMask(64, 48)
+    _stroke(sm, [(5, 5), (30, 5)])
+    after_first = sm.mask.copy()
+    _stroke(sm, [(10, 40), (10, 10)])
+    after_second = sm.mask.copy()
+
+    assert sm.undo()
+    assert np.array_equal(sm.mask, after_first)
+    assert sm.undo()
+    assert not sm.mask.any()
+    assert not sm.undo()
+
+    assert sm.redo()
+    assert sm.redo()
+    assert np.array_equal(sm.mask, after_second)
+    assert not sm.redo()
+
+
+def test_erase_stroke_and_undo():
+    sm = StrokeMask(32, 32)
+    _stroke(sm, [(0, 16), (31, 16)], radius=4)
+    painted = sm.mask.copy()
+    _stroke(sm, [(16, 16)], radius=4, erase=True)
+    assert sm.mask[16, 16] == 0
+    sm.undo()
+    assert np.array_equal(sm.mask, painted)
+
+
+def test_new_stroke_drops_redo_branch():
+    sm = StrokeMask(32, 32)
+    _stroke(sm, [(5, 5)])
+    _stroke(sm, [(20, 20)])
+    sm.undo()
+    _stroke(sm, [(5, 25)])
+    assert not sm.can_redo()
+    assert len(sm.strokes) == 2
+    assert sm.mask[20, 20] == 0
+
+
+def test_undo_across_snapshots():
+    sm = StrokeMask(40, 40)
+    states = [sm.mask.copy()]
+    for i in range(stroke_mask.SNAPSHOT_EVERY * 2 + 3):
+        _stroke(sm, [(i % 40, 0), (i % 40, 39)], radius=1, erase=i % 5 == 4)
+        states.append(sm.mask.copy())
+
+    for expected in reversed(states[:-1]):
+        sm.undo()
+        assert np.array_equal(sm.mask, expected)
+
+
+def test_rasterize_scales_log():
+    sm = StrokeMask(100, 100)
+    _stroke(sm, [(10, 50), (90, 50)], radius=5)
+    assert np.array_equal(sm.rasterize((100, 100)), sm.mask)
+
+    big = sm.rasterize((400, 200))
+    assert big.shape == (200, 400)
+    assert big[100, 200] == 1
+    assert big[10, 200] == 0
+
+
+def test_rasterize_ignores_undone_strokes():
+    sm = StrokeMask(50, 50)
+    _stroke(sm, [(25, 25)], radius=5)
+    sm.undo()
+    assert not sm.rasterize((200, 200)).any()
+
+
+def test_json_roundtrip():
+    sm = StrokeMask(60, 40)
+    _stroke(sm, [(5, 5), (50, 30)])
+    _stroke(sm, [(30, 20)], radius=6, erase=True)
+    _stroke(sm, [(1, 1)])
+    sm.undo()
+
+    restored = StrokeMask.from_json(sm.to_json())
+    assert (restored.width, restored.height) == (60, 40)
+    assert len(restored.strokes) == 2
+    assert np.array_equal(restored.mask, sm.mask)
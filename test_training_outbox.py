@@ -0,0 +1,61 @@
+import training_outbox
+from history_store import HistoryStore
+from training_outbox import TrainingOutbox
+
+
+def _rec(ts: str) -> dict:
+    return {"ts": ts, "user_stage": 1, "ai_stage": 1, "score": 5, "dice": 0.5, "p_max": 0.9}
+
+
+def _outbox(tmp_path, monkeypatch, answer):
+    store = HistoryStore(str(tmp_path / "h.sqlite3"), "alice")
+    sent = []
+
+    def save(records):
+        sent.append([r["idempotency_key"] for r in records])
+        return [answer(r) for r in records]
+
+    monkeypatch.setattr(training_outbox, "save_training_records", save)
+    return store, TrainingOutbox(store), sent
+
+
+def _flush_times(outbox: TrainingOutbox, times: int):
+    for _ in range(times):
+        # не ждать паузы между попытками
+        with outbox.store._lock, outbox.store._db:
+            outbox.store._db.execute("UPDATE outbox SET next_try = 0")
+        outbox._flush()
+
+
+def test_rejected_record_is_parked_after_max_attempts(tmp_path, monkeypatch):
+    store, outbox, sent = _outbox(
+        tmp_path, monkeypatch, lambda r: "invalid stage" if r["idempotency_key"] == "bad" else None)
+    store.add(_rec("2024-05-01T10:00:00"), outbox_key="bad")
+    store.add(_rec("2024-05-01T11:00:00"), outbox_key="good")
+
+    _flush_times(outbox, training_outbox.MAX_ATTEMPTS + 2)
+    assert sum(keys.count("bad") for keys in sent) == training_outbox.MAX_ATTEMPTS
+    assert store.outbox_count() == 0
+    assert store.outbox_due() == []
+    assert store.summary()["total"] == 2
+
+    with store._lock:
+        row = store._db.execute("SELECT parked, last_error FROM outbox WHERE key = 'bad'").fetchone()
+    assert tuple(row) == (1, "invalid stage")
+
+
+def test_server_errors_are_not_parked(tmp_path, monkeypatch):
+    store, outbox, _ = _outbox(tmp_path, monkeypatch, lambda r: "HTTP 503")
+    store.add(_rec("2024-05-01T10:00:00"), outbox_key="k")
+
+    _flush_times(outbox, training_outbox.MAX_ATTEMPTS + 2)
+    assert store.outbox_count() == 1
+
+
+def test_network_error_does_not_count_attempt(tmp_path, monkeypatch):
+    store, outbox, _ = _outbox(tmp_path, monkeypatch, lambda r: training_outbox.NETWORK_ERROR)
+    store.add(_rec("2024-05-01T10:00:00"), outbox_key="k")
+
+    outbox._flush()
+    assert [a for _, _, a in store.outbox_due()] == [0]
+    assert outbox._offline_delay > 0
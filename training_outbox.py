@@ -0,0 +1,116 @@
+# training_outbox.py
+import threading
+import time
+
+from PyQt5 import QtCore
+
+from api_client import NETWORK_ERROR, save_training_records
+from history_store import HistoryStore
+
+BATCH = 50
+BACKOFF = 2.0        # с, удваивается с каждой неудачной попыткой
+MAX_BACKOFF = 300.0
+MAX_ATTEMPTS = 5     # после стольких попыток запись, которую сервер отклоняет, не отправляется
+IDLE = 60.0          # с, период проверки очереди без явных событий
+QUIT_WAIT_MS = 2000  # сколько ждать текущую отправку при выходе из приложения
+
+# остановленные, но ещё не завершившиеся потоки: окно после выхода из
+# аккаунта уничтожается, а QThread нельзя удалять, пока он работает
+_draining: set = set()
+
+
+class TrainingOutbox(QtCore.QThread):
+    """
+    Отправка результатов тренировок на сервер в фоне.
+
+    Запись сначала попадает в таблицу outbox локальной базы (вместе с самой
+    записью истории, одной транзакцией), поэтому интерфейс не ждёт сеть, а
+    при падении сервера или приложения ничего не теряется. Поток отправляет
+    очередь пачками; у каждой записи свой ключ идемпотентности, так что
+    повтор после обрыва связи не создаёт дубликат на сервере.
+    """
+    pending_changed = QtCore.pyqtSignal(int)   # сколько записей ещё не отправлено
+
+    def __init__(self, store: HistoryStore):
+        super().__init__()
+        self.store = store
+        self._wake = threading.Event()
+        self._stopping = False
+        self._offline_delay = 0.0
+        app = QtCore.QCoreApplication.instance()
+        if app is not None:
+            app.aboutToQuit.connect(self._on_quit)
+
+    def pending(self) -> int:
+        return self.store.outbox_count()
+
+    def kick(self):
+        """Попробовать отправить очередь сейчас (новая запись, сеть вернулась)."""
+        self._wake.set()
+        if not self.isRunning() and not self._stopping:
+            self.start()
+
+    def stop(self):
+        """
+        Не ждёт текущий запрос: поток завершится после него сам, а
+        неотправленное останется в базе до следующего входа.
+        """
+        self._stopping = True
+        self._wake.set()
+        if self.isRunning() and self not in _draining:
+            _draining.add(self)
+            self.finished.connect(lambda: _draining.discard(self))
+
+    def _on_quit(self):
+        self.stop()
+        if self.isRunning():
+            self.wait(QUIT_WAIT_MS)
+
+    def run(self):
+        self.pending_changed.emit(self.pending())
+        while not self._stopping:
+            self._wake.clear()
+            try:
+                self._flush()
+            except Exception:
+                pass
+            self.pending_changed.emit(self.pending())
+            self._wake.wait(self._next_delay())
+
+    def _next_delay(self) -> float:
+        if self._offline_delay:
+            return self._offline_delay
+        next_try = self.store.outbox_next_try()
+        if next_try is None:
+            return IDLE
+        return min(IDLE, max(0.5, next_try - time.time()))
+
+    def _flush(self):
+        while not self._stopping:
+            due = self.store.outbox_due(BATCH)
+            if not due:
+                return
+            errors = save_training_records([dict(rec, idempotency_key=key) for key, rec, _ in due])
+            sent = []
+            offline = False
+            for (key, _, attempts), err in zip(due, errors):
+                if err is None:
+                    sent.append(key)
+                elif err == NETWORK_ERROR:
+                    # до записи не дошло — попытка не считается, ждёт вся очередь
+                    offline = True
+                elif attempts + 1 >= MAX_ATTEMPTS and not err.startswith("HTTP "):
+                    # сервер раз за разом отклоняет саму запись — она остаётся
+                    # локально с причиной отказа, но очередь и счётчик не держит;
+                    # временные ошибки сервера ("HTTP 503") повторяются дальше
+                    self.store.outbox_park(key, err)
+                else:
+                    self.store.outbox_retry(key, min(MAX_BACKOFF, BACKOFF * 2 ** min(attempts, 16)), err)
+            self.store.outbox_done(sent)
+            self.pending_changed.emit(self.pending())
+            if offline:
+                # сеть недоступна — интервал растёт; уже принятое сервером
+                # не задвоится благодаря ключам
+                self._offline_delay = min(MAX_BACKOFF, max(BACKOFF, self._offline_delay * 2))
+                return
+            self._offline_delay = 0.0
@@ -1,5 +1,6 @@
 from PyQt5 import QtWidgets, QtCore, QtGui
 from api_client import change_password
+import task_pool
 
 class RoundedDialog(QtWidgets.QDialog):
     def __init__(self, title: str, text: str, kind: str = "info"):
@@ -649,6 +650,7 @@ class ChangePasswordDialog(QtWidgets.QDialog):
         cancel.clicked.connect(self.reject)
 
         save_btn = QtWidgets.QPushButton("Сохранить")
+        self.save_btn = save_btn
         save_btn.setFixedHeight(40)
         save_btn.setStyleSheet("""
             QPushButton {
@@ -715,7 +717,27 @@ class ChangePasswordDialog(QtWidgets.QDialog):
             RoundedDialog.warning("Ошибка", "Новый пароль и повтор не совпадают.")
             return
 
-        if not change_password(self.username, old_pw, new_pw):
+        if not self.save_btn.isEnabled():
+            return
+
+        # запрос — в фоне, диалог не замирает на холодном старте сервера
+        self._set_busy(True)
+        t = task_pool.run("auth", change_password, self.username, old_pw, new_pw)
+        t.ok.connect(self._on_saved)
+        t.fail.connect(lambda _: self._on_saved(None))
+
+    def _set_busy(self, busy: bool):
+        self.save_btn.setEnabled(not busy)
+        self.save_btn.setText("Сохранение…" if busy else "Сохранить")
+
+    def _on_saved(self, ok):
+        self._set_busy(False)
+        if not self.isVisible():
+            return
+        if ok is None:
+            RoundedDialog.warning("Ошибка", "Не удалось связаться с сервером. Проверьте подключение и попробуйте ещё раз.")
+            return
+        if not ok:
             RoundedDialog.warning("Ошибка", "Текущий пароль введён неверно (или вы не авторизованы).")
             return
 
@@ -728,20 +750,3 @@ class ChangePasswordDialog(QtWidgets.QDialog):
         if parent is not None:
             d.setFixedSize(parent.size())
         return d.exec_() == QtWidgets.QDialog.Accepted
-    
-class ApiWorker(QtCore.QThread):
-    ok = QtCore.pyqtSignal(object)      # результат
-    fail = QtCore.pyqtSignal(str)       # ошибка
-
-    def __init__(self, fn, *args, **kwargs):
-        super().__init__()
-        self._fn = fn
-        self._args = args
-        self._kwargs = kwargs
-
-    def run(self):
-        try:
-            res = self._fn(*self._args, **self._kwargs)
-            self.ok.emit(res)
-        except Exception as e:
-            self.fail.emit(str(e))
\ No newline at end of file